@@ -0,0 +1,69 @@
+"""Shared helpers for the offline benchmarks"""
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+# Placeholder settings so the services import without a real .env
+DB_ENV = {
+    "SUPABASE_URL": "http://localhost:54321",
+    "SUPABASE_KEY": "eyJhbGciOiJIUzI1NiJ9.eyJyb2xlIjoiYW5vbiJ9.benchmark",
+    "JWT_SECRET_KEY": "benchmark-secret-benchmark-secret",
+    "FRONTEND_URL": "http://localhost:5173",
+}
+SERVER_ENV = {
+    "API_KEY": "sk-benchmark",
+    "MODEL": "gpt-4o-mini",
+    "DB_API_ADDY": "http://127.0.0.1:8000",
+}
+
+def add_path(*parts):
+    path = os.path.join(ROOT, *parts)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+def load_db_api(latency=0.0, **env):
+    """Import db/dbAPI.py with an in-memory supabase that sleeps latency per query"""
+    for key, value in {**DB_ENV, **env}.items():
+        os.environ.setdefault(key, str(value))
+    add_path("db")
+    add_path("benchmarks")
+    import dbAPI
+    from fake_supabase import FakeSupabase
+    dbAPI.supabase = FakeSupabase(latency=latency)
+    return dbAPI
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q * (len(values) - 1))))
+    return values[index]
+
+def summarize(latencies):
+    return {
+        "count": len(latencies),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+    }
+
+def save_results(name, results):
+    """Write results to benchmarks/results/<name>-<timestamp>.json and return the path"""
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(RESULTS_DIR, f"{name}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": name,
+            "timestamp": stamp,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, f, indent=2)
+    return path
@@ -0,0 +1,68 @@
+"""
+Load benchmark for db/dbAPI.py request concurrency.
+
+Every supabase query sleeps --latency seconds, like a PostgREST round trip.
+The API is driven in-process through httpx's ASGI transport at increasing
+client concurrency, once per DB_POOL_SIZE, so you can see throughput scale
+with the pool instead of serializing on the event loop.
+
+    python benchmarks/db_concurrency.py --latency 0.05 --requests 400
+"""
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from common import load_db_api, summarize, save_results
+
+async def drive(app, requests, concurrency, email):
+    import httpx
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(f"/applications/user/{email}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(requests)))
+        elapsed = time.perf_counter() - start
+    return requests / elapsed, summarize(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per supabase query")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--pool-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--save", action="store_true", help="write results to benchmarks/results")
+    args = parser.parse_args()
+
+    dbAPI = load_db_api(latency=args.latency)
+    email = "bench@example.com"
+    for i in range(50):
+        dbAPI.supabase.insert("applications", {
+            "email": email, "company_name": f"Company {i}",
+            "job_title": "Engineer", "status": "Pending Response",
+        })
+
+    results = []
+    print(f"{'pool':>5} {'conc':>5} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for pool_size in args.pool_sizes:
+        dbAPI.db_executor = ThreadPoolExecutor(max_workers=pool_size)
+        for concurrency in args.concurrency:
+            throughput, latency = asyncio.run(drive(dbAPI.app, args.requests, concurrency, email))
+            results.append({"pool_size": pool_size, "concurrency": concurrency,
+                            "requests_per_second": throughput, "latency": latency})
+            print(f"{pool_size:>5} {concurrency:>5} {throughput:>9.1f} "
+                  f"{latency['p50'] * 1000:>8.1f} {latency['p99'] * 1000:>8.1f}")
+        dbAPI.db_executor.shutdown()
+
+    if args.save:
+        print(f"Saved {save_results('db_concurrency', results)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+End to end throughput of EmailMonitor.run_once, fully offline.
+
+Everything the monitor talks to runs in this process:
+  - IMAP: fake_imap.py, one synthetic inbox of --emails messages per user
+  - OpenAI: fake_openai.py, answering after --llm-latency (+ --llm-jitter) seconds
+  - DB API: the real db/dbAPI.py under uvicorn, on fake_supabase.py with --db-latency
+
+Each run clears the sync state and applications, then calls run_once for
+--users users. Reported per run: emails/s, sweep p50/p99 (connect to last
+write, per inbox) and per pipeline stage the cost per item and how busy
+its workers were. Monitor settings such as LLM_BATCH_SIZE or
+PIPELINE_PARSE_WORKERS are read from the environment as usual.
+
+    python benchmarks/end_to_end.py --users 20 --emails 200 --save
+    python benchmarks/end_to_end.py --baseline benchmarks/results/end_to_end-<stamp>.json
+
+With --baseline the exit status is 1 when emails/s dropped, or sweep p99
+grew, by more than --tolerance against the saved run.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import logging
+import argparse
+import tempfile
+import statistics
+import threading
+from common import SERVER_ENV, add_path, load_db_api, percentile, save_results
+from fake_imap import FakeImapServer
+from fake_openai import FakeOpenAI
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_db_api(latency, users, password):
+    """Serve db/dbAPI.py on a local port with the users seeded, returns (dbAPI, base url)"""
+    import uvicorn
+    dbAPI = load_db_api(latency=latency)
+    dbAPI.limiter.enabled = False
+    for i in range(users):
+        dbAPI.supabase.insert("users", {
+            "email": f"user{i}@bench.example", "password": "-", "Name": f"User {i}",
+            "Listening": True, "email_app_password": password,
+        })
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(dbAPI.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="db-api", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return dbAPI, f"http://127.0.0.1:{port}"
+
+def load_monitor(db_url, llm_url, cache_dir):
+    """Import server/EmailMonitor.py pointed at the local stand-ins"""
+    os.environ["DB_API_ADDY"] = db_url
+    os.environ["API_BASE_URL"] = llm_url
+    for key, value in {**SERVER_ENV, "CACHE_PATH": os.path.join(cache_dir, "cache.sqlite3"),
+                       "CACHE_TTL": "0", "PIPELINE_REPORT_INTERVAL": "3600"}.items():
+        os.environ.setdefault(key, value)
+    add_path("server")
+    import Pipeline
+    import EmailMonitor
+    return EmailMonitor, Pipeline
+
+def run(EmailMonitor, Pipeline, dbAPI, imap_port):
+    """One run_once, returns its measurements"""
+    import imaplib
+    pipelines, sweeps = [], []
+
+    def connect(email_address, password, imap_server=None):
+        imap = imaplib.IMAP4("127.0.0.1", imap_port)
+        imap.login(email_address, password)
+        return imap
+
+    def run_pipeline(users, connect, get_content, **kwargs):
+        pipeline = Pipeline.Pipeline(connect, get_content, **kwargs)
+        pipelines.append(pipeline)
+        return pipeline.run(users), pipeline.stats()
+
+    finish = Pipeline.UserSweep._finish
+
+    def timed_finish(sweep):
+        sweeps.append(time.monotonic() - sweep.started)
+        finish(sweep)
+
+    # Every run starts from unread inboxes and an empty applications table
+    for table in ("mail_sync_state", "applications"):
+        dbAPI.supabase.tables.pop(table, None)
+    EmailMonitor.client.latency.histograms.clear()
+
+    EmailMonitor.connect_to_email = connect
+    EmailMonitor.run_pipeline = run_pipeline
+    Pipeline.UserSweep._finish = timed_finish
+    start = time.perf_counter()
+    try:
+        EmailMonitor.run_once()
+    finally:
+        Pipeline.UserSweep._finish = finish
+    elapsed = time.perf_counter() - start
+
+    if not pipelines:
+        raise RuntimeError("run_once never reached the pipeline, is the DB API up?")
+    pipeline = pipelines[0]
+    emails = pipeline.fetch.emitted
+    stages = {}
+    for stage in pipeline.stages:
+        stages[stage.name] = {
+            "workers": stage.workers,
+            "items": stage.processed,
+            "ms_per_item": stage.busy / stage.processed * 1000 if stage.processed else 0.0,
+            "utilization": stage.busy / (pipeline.elapsed * stage.workers) if pipeline.elapsed else 0.0,
+            "max_queue_depth": stage.max_depth,
+        }
+    return {
+        "seconds": elapsed,
+        "emails": emails,
+        "emails_per_second": emails / elapsed if elapsed else 0.0,
+        "sweep_p50": percentile(sweeps, 0.50),
+        "sweep_p99": percentile(sweeps, 0.99),
+        "applications": len(dbAPI.supabase.tables.get("applications", [])),
+        "stages": stages,
+        "db_api": EmailMonitor.client.latency.summary(),
+    }
+
+def compare(summary, baseline_path, tolerance):
+    """Print the change against a saved run, returns False on a regression"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]["summary"]
+    ok = True
+    for key, higher_is_better in (("emails_per_second", True), ("sweep_p99", False)):
+        before, now = baseline[key], summary[key]
+        change = (now - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        flag = "REGRESSION" if worse > tolerance else "ok"
+        ok = ok and worse <= tolerance
+        print(f"{key:<18} baseline {before:10.3f}  now {now:10.3f}  ({change:+.0%}) {flag}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--emails", type=int, default=100, help="messages per inbox")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per classifier request")
+    parser.add_argument("--llm-jitter", type=float, default=0.1)
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per supabase query")
+    parser.add_argument("--imap-latency", type=float, default=0.005, help="seconds per IMAP command")
+    parser.add_argument("--attachment-kb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="results file from an earlier --save to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="keep the monitor's INFO logs")
+    parser.add_argument("--save", action="store_true", help="write results to benchmarks/results")
+    args = parser.parse_args()
+
+    password = "bench-app-password"
+    imap = FakeImapServer(inbox_size=args.emails, latency=args.imap_latency, seed=args.seed,
+                          attachment_kb=args.attachment_kb).start()
+    llm = FakeOpenAI(latency=args.llm_latency, jitter=args.llm_jitter).start()
+    dbAPI, db_url = start_db_api(args.db_latency, args.users, password)
+    cache_dir = tempfile.mkdtemp(prefix="end_to_end-")
+    EmailMonitor, Pipeline = load_monitor(db_url, llm.base_url, cache_dir)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    runs = []
+    print(f"{args.users} users x {args.emails} emails, LLM {args.llm_latency * 1000:.0f} ms, "
+          f"DB {args.db_latency * 1000:.0f} ms, IMAP {args.imap_latency * 1000:.0f} ms per command")
+    print(f"{'run':>3} {'emails':>7} {'seconds':>8} {'emails/s':>9} {'sweep p50':>10} {'sweep p99':>10} {'LLM calls':>10}")
+    for i in range(args.runs):
+        requests_before = llm.requests
+        result = run(EmailMonitor, Pipeline, dbAPI, imap.port)
+        result["llm_requests"] = llm.requests - requests_before
+        runs.append(result)
+        print(f"{i + 1:>3} {result['emails']:>7} {result['seconds']:>8.2f} {result['emails_per_second']:>9.1f} "
+              f"{result['sweep_p50']:>9.2f}s {result['sweep_p99']:>9.2f}s {result['llm_requests']:>10}")
+
+    # Stage costs of the median run by throughput
+    median = sorted(runs, key=lambda r: r["emails_per_second"])[len(runs) // 2]
+    print(f"\n{'stage':<10} {'workers':>7} {'items':>7} {'ms/item':>9} {'busy':>6} {'max queue':>10}")
+    for name, stage in median["stages"].items():
+        print(f"{name:<10} {stage['workers']:>7} {stage['items']:>7} {stage['ms_per_item']:>9.2f} "
+              f"{stage['utilization']:>6.0%} {stage['max_queue_depth']:>10}")
+
+    summary = {
+        "emails_per_second": statistics.median(r["emails_per_second"] for r in runs),
+        "sweep_p50": statistics.median(r["sweep_p50"] for r in runs),
+        "sweep_p99": statistics.median(r["sweep_p99"] for r in runs),
+    }
+    print(f"\nMedian of {len(runs)} runs: {summary['emails_per_second']:.1f} emails/s, "
+          f"sweep p50 {summary['sweep_p50']:.2f}s, p99 {summary['sweep_p99']:.2f}s")
+
+    config = {key: value for key, value in vars(args).items() if key not in ("save", "baseline", "verbose")}
+    config["monitor_env"] = {key: os.environ[key] for key in (
+        "LLM_BATCH_SIZE", "LLM_MAX_IN_FLIGHT", "MAX_CONCURRENT_USERS", "PIPELINE_PARSE_WORKERS",
+        "PIPELINE_WRITE_BATCH", "FETCH_CHUNK_SIZE") if key in os.environ}
+    if args.save:
+        print(f"Saved {save_results('end_to_end', {'config': config, 'runs': runs, 'summary': summary})}")
+
+    imap.stop()
+    llm.stop()
+    if args.baseline and not compare(summary, args.baseline, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+Minimal IMAP4rev1 server over plain TCP for the offline benchmarks.
+
+Speaks just what the monitor sends: CAPABILITY, LOGIN, SELECT, UID SEARCH,
+UID FETCH (BODY.PEEK[...] with partial ranges, BODYSTRUCTURE, UID), NOOP,
+IDLE and LOGOUT. Every login gets its own synthetic inbox, built once from
+the user name and a seed so runs are reproducible. --latency seconds are
+slept before answering each command, like a round trip to a real server.
+deliver() adds mail to an inbox; connections hear about it through an
+untagged EXISTS on their next command, or right away while idling.
+"""
+import re
+import time
+import random
+import base64
+import select
+import threading
+import socketserver
+
+COMPANIES = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark Industries", "Wayne Enterprises",
+             "Wonka", "Cyberdyne", "Soylent", "Tyrell", "Massive Dynamic", "Aperture", "Vandelay"]
+TITLES = ["Software Engineer", "Backend Engineer", "Data Engineer", "Platform Engineer",
+          "Frontend Developer", "Site Reliability Engineer", "QA Engineer", "Product Engineer"]
+ATS_SENDERS = ["no-reply@greenhouse.io", "jobs@lever.co", "donotreply@myworkday.com", "talent@ashbyhq.com"]
+NOISE = [
+    ("newsletter@substack.com", "This week in distributed systems", "Five links worth reading this week."),
+    ("receipts@stripe.com", "Your receipt from Coffee Co", "Amount paid $4.50. Thanks for your order."),
+    ("notify@github.com", "Re: Fix flaky test in CI", "LGTM, merging once the build is green."),
+    ("friends@social.example", "Photos from Saturday", "Here are the photos from the picnic!"),
+]
+FILLER = ("We review every submission carefully and will be in touch about next steps. "
+          "In the meantime, feel free to learn more about our team and culture on our site. ")
+
+class Message:
+    """One synthetic message: raw header, text/attachment sections and their BODYSTRUCTURE"""
+
+    def __init__(self, uid, sender, subject, plain, attachment=None):
+        self.uid = uid
+        html = "<html><body>" + "".join(f"<p>{line}</p>" for line in plain.split("\n") if line) + "</body></html>"
+        self.sections = {}
+        text = []
+        for subtype, body in (("plain", plain), ("html", html)):
+            data = body.replace("\n", "\r\n").encode("utf-8")
+            lines = data.count(b"\n") + 1
+            text.append(f'("text" "{subtype}" ("charset" "utf-8") NIL NIL "8bit" {len(data)} {lines})')
+            self.sections[str(len(text))] = data
+        alternative = "(" + "".join(text) + ' "alternative")'
+
+        if attachment:
+            data = base64.encodebytes(attachment)
+            self.sections = {f"1.{key}": value for key, value in self.sections.items()}
+            self.sections["2"] = data
+            self.structure = (f'({alternative}("application" "pdf" ("name" "offer.pdf") NIL NIL "base64" {len(data)} '
+                              f'NIL ("attachment" ("filename" "offer.pdf")) NIL) "mixed")')
+            content_type = 'multipart/mixed; boundary="mixed"'
+        else:
+            self.structure = alternative
+            content_type = 'multipart/alternative; boundary="alt"'
+        self.header = (f"From: {sender}\r\nTo: applicant@example.com\r\nSubject: {subject}\r\n"
+                       f"Message-ID: <{uid}@bench>\r\nMIME-Version: 1.0\r\n"
+                       f"Content-Type: {content_type}\r\n\r\n").encode("utf-8")
+
+def build_inbox(user, size, seed=0, job_ratio=0.4, attachment_ratio=0.1, attachment_kb=256):
+    """size messages for user, about job_ratio of them job related, UIDs from 1"""
+    rng = random.Random(f"{seed}:{user}")
+    messages = []
+    for uid in range(1, size + 1):
+        company, title = rng.choice(COMPANIES), rng.choice(TITLES)
+        attachment = None
+        if rng.random() >= job_ratio:
+            sender, subject, plain = rng.choice(NOISE)
+            plain = f"{plain}\n\nReference {uid}-{rng.randrange(10 ** 6)}"
+        elif rng.random() < 0.6:
+            sender = rng.choice(ATS_SENDERS)
+            subject = f"Thank you for applying to {company}"
+            plain = (f"Hi,\n\nThank you for applying to {company} for the {title} role. "
+                     f"We received your application.\n\n{FILLER * rng.randint(1, 4)}\n{company} Recruiting")
+        else:
+            sender = rng.choice(ATS_SENDERS)
+            if rng.random() < 0.5:
+                subject = f"Update on your {company} application"
+                plain = (f"Hi,\n\nThank you for your interest in the {title} role at {company}. Unfortunately "
+                         f"we will not be moving forward with your application.\n\n{company} Recruiting")
+            else:
+                subject = f"Interview invitation from {company}"
+                plain = (f"Hi,\n\nWe'd like to invite you to interview for the {title} role at {company}. "
+                         f"Please pick a slot for a phone screen.\n\n{company} Recruiting")
+        if rng.random() < attachment_ratio:
+            attachment = rng.randbytes(attachment_kb * 1024)
+        messages.append(Message(uid, sender, subject, plain, attachment))
+    return messages
+
+_FETCH_ITEM = re.compile(r'BODY\.PEEK\[([^\]]*)\](?:<(\d+)\.(\d+)>)?|BODYSTRUCTURE|UID|FLAGS', re.I)
+
+def _uid_set(spec, uids):
+    """Expand an IMAP set such as 1:3,7 or 5:* against the mailbox UIDs"""
+    top = max(uids, default=0)
+    wanted = set()
+    for part in spec.split(","):
+        if ":" in part:
+            low, high = part.split(":")
+            low = top if low == "*" else int(low)
+            high = top if high == "*" else int(high)
+            low, high = min(low, high), max(low, high)
+            wanted.update(uid for uid in uids if low <= uid <= high)
+        else:
+            uid = top if part == "*" else int(part)
+            if uid in uids:
+                wanted.add(uid)
+    return sorted(wanted)
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def send(self, data):
+        self.wfile.write(data if isinstance(data, bytes) else data.encode("utf-8"))
+
+    def announce(self, inbox, by_uid):
+        """Report mail delivered since this connection last heard, like a real server"""
+        if len(inbox) > self.known:
+            self.known = len(inbox)
+            by_uid.update((message.uid, message) for message in inbox)
+            self.send(f"* {self.known} EXISTS\r\n")
+
+    def idle(self, tag, inbox, by_uid):
+        self.send("+ idling\r\n")
+        while True:
+            self.announce(inbox, by_uid)
+            readable, _, _ = select.select([self.connection], [], [], 0.05)
+            if not readable:
+                continue
+            line = self.rfile.readline()
+            if not line:
+                return False
+            if line.strip().upper() == b"DONE":
+                self.send(f"{tag} OK IDLE terminated\r\n")
+                return True
+            self.send(f"{tag} BAD expected DONE\r\n")
+            return True
+
+    def handle(self):
+        server = self.server
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] fake_imap ready\r\n")
+        inbox, by_uid = [], {}
+        self.known = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode("utf-8", "replace").rstrip("\r\n").partition(" ")
+            command, _, args = rest.partition(" ")
+            command = command.upper()
+            if server.latency:
+                time.sleep(server.latency)
+            server.count(command)
+
+            if command == "CAPABILITY":
+                self.send(f"* CAPABILITY IMAP4rev1 IDLE\r\n{tag} OK CAPABILITY completed\r\n")
+            elif command == "LOGIN":
+                user = args.split(" ", 1)[0].strip('"')
+                inbox = server.inbox(user)
+                by_uid = {message.uid: message for message in inbox}
+                self.send(f"{tag} OK LOGIN completed\r\n")
+            elif command in ("SELECT", "EXAMINE"):
+                with server.lock:
+                    self.known = len(inbox)
+                    by_uid = {message.uid: message for message in inbox}
+                self.send(f"* {len(inbox)} EXISTS\r\n* 0 RECENT\r\n* OK [UIDVALIDITY 1] UIDs valid\r\n"
+                          f"* OK [UIDNEXT {len(inbox) + 1}] Predicted next UID\r\n"
+                          f"{tag} OK [READ-WRITE] {command} completed\r\n")
+            elif command == "UID":
+                self.announce(inbox, by_uid)
+                sub, _, args = args.partition(" ")
+                if sub.upper() == "SEARCH":
+                    criteria = args.split()
+                    uids = list(by_uid)
+                    if len(criteria) >= 2 and criteria[-2].upper() == "UID":
+                        uids = _uid_set(criteria[-1], uids)
+                    self.send(f"* SEARCH {' '.join(map(str, uids))}\r\n{tag} OK SEARCH completed\r\n")
+                elif sub.upper() == "FETCH":
+                    spec, _, items = args.partition(" ")
+                    for uid in _uid_set(spec, list(by_uid)):
+                        self.send_fetch(uid, by_uid[uid], items)
+                    self.send(f"{tag} OK FETCH completed\r\n")
+                else:
+                    self.send(f"{tag} BAD UID {sub} not supported\r\n")
+            elif command == "NOOP":
+                self.announce(inbox, by_uid)
+                self.send(f"{tag} OK NOOP completed\r\n")
+            elif command == "IDLE":
+                if not self.idle(tag, inbox, by_uid):
+                    return
+            elif command == "LOGOUT":
+                self.send(f"* BYE logging out\r\n{tag} OK LOGOUT completed\r\n")
+                return
+            else:
+                self.send(f"{tag} BAD {command} not supported\r\n")
+
+    def send_fetch(self, uid, message, items):
+        out = [f"* {uid} FETCH (UID {uid}".encode("ascii")]
+        for match in _FETCH_ITEM.finditer(items):
+            item = match.group(0).upper()
+            if item == "BODYSTRUCTURE":
+                out.append(f" BODYSTRUCTURE {message.structure}".encode("utf-8"))
+            elif item == "FLAGS":
+                out.append(b" FLAGS ()")
+            elif item.startswith("BODY"):
+                section = match.group(1).upper()
+                data = message.header if section == "HEADER" else message.sections.get(section, b"")
+                name = f"BODY[{section}]"
+                if match.group(2) is not None:
+                    start, length = int(match.group(2)), int(match.group(3))
+                    data = data[start:start + length]
+                    name += f"<{start}>"
+                out.append(f" {name} {{{len(data)}}}\r\n".encode("ascii") + data)
+        out.append(b")\r\n")
+        self.send(b"".join(out))
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    """server = FakeImapServer(inbox_size=200); server.start(); ... server.stop()"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, inbox_size=100, latency=0.0, seed=0, host="127.0.0.1", port=0, **inbox_options):
+        super().__init__((host, port), _Handler)
+        self.inbox_size = inbox_size
+        self.latency = latency
+        self.seed = seed
+        self.inbox_options = inbox_options
+        self.commands = {}
+        self._inboxes = {}
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def inbox(self, user):
+        with self.lock:
+            if user not in self._inboxes:
+                self._inboxes[user] = build_inbox(user, self.inbox_size, self.seed, **self.inbox_options)
+            return self._inboxes[user]
+
+    def deliver(self, user, sender, subject, plain):
+        """Append a new message to user's inbox, returns its UID"""
+        inbox = self.inbox(user)
+        with self.lock:
+            uid = len(inbox) + 1
+            inbox.append(Message(uid, sender, subject, plain))
+            return uid
+
+    def count(self, command):
+        with self.lock:
+            self.commands[command] = self.commands.get(command, 0) + 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-imap", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
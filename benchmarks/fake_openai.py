@@ -0,0 +1,90 @@
+"""
+OpenAI compatible /v1/chat/completions stub for the offline benchmarks.
+
+Answers the monitor's structured output requests, single emails and
+"### Email N" batches alike, by matching the phrases fake_imap.py writes,
+so classifications (and the DB writes after them) look like the real thing.
+Every request sleeps `latency` seconds plus up to `jitter` more.
+"""
+import re
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+_EMAIL = re.compile(r'^### Email \d+$', re.M)
+_APPLIED = re.compile(r'applying to (.+?) for the (.+?) role')
+_ROLE_AT = re.compile(r'the (.+?) role at (.+?)\.')
+
+def classify(text):
+    """The answer a good model would give for one synthetic email"""
+    applied = _APPLIED.search(text)
+    if applied:
+        return {"type": 1, "company_name": applied.group(1), "job_title": applied.group(2),
+                "status": "Pending Response", "date": "-"}
+    role = _ROLE_AT.search(text)
+    if role:
+        status = "Rejected" if "not be moving forward" in text else "Interview Scheduled"
+        return {"type": 2, "company_name": role.group(2), "job_title": role.group(1),
+                "status": status, "date": time.strftime("%d/%m/%Y")}
+    return {"type": 0, "company_name": "-", "job_title": "-", "status": "-", "date": "-"}
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        emails = _EMAIL.split(prompt)[1:]
+        content = {"results": [classify(email) for email in emails]} if emails else classify(prompt)
+        server.record(len(emails) or 1)
+        time.sleep(server.latency + random.uniform(0, server.jitter))
+
+        words = sum(len(message["content"].split()) for message in body["messages"])
+        out = json.dumps({
+            "id": "chatcmpl-bench", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps(content)}}],
+            "usage": {"prompt_tokens": words, "completion_tokens": 30 * (len(emails) or 1),
+                      "total_tokens": words + 30 * (len(emails) or 1)},
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+class FakeOpenAI(ThreadingHTTPServer):
+    """server = FakeOpenAI(latency=0.5).start(); API_BASE_URL=server.base_url"""
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0, jitter=0.0, host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+        self.emails = 0
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def record(self, emails):
+        with self._lock:
+            self.requests += 1
+            self.emails += emails
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-openai", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
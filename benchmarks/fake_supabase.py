@@ -0,0 +1,299 @@
+"""
+In-memory stand-in for the supabase client used by db/dbAPI.py.
+
+Supports the query builder calls the API makes (select, insert, upsert,
+update, eq, in_, ilike, lt, gt, or_, order, limit, single, rpc) and sleeps for
+`latency` seconds on every execute() to mimic a PostgREST round trip.
+"""
+import re
+import time
+import string
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, UTC
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.mode = "select"
+        self.columns = None
+        self.filters = []
+        self.orders = []
+        self.max_rows = None
+        self.payload = None
+        self.on_conflict = None
+        self.ignore_duplicates = False
+        self.single_row = False
+
+    # --- builder -------------------------------------------------------
+    def select(self, *columns, **kwargs):
+        joined = ",".join(columns)
+        self.columns = None if joined in ("", "*") else [c.strip() for c in joined.split(",")]
+        return self
+
+    def insert(self, rows):
+        self.mode, self.payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict="", ignore_duplicates=False):
+        self.mode, self.payload = "upsert", rows
+        self.on_conflict = [c.strip() for c in on_conflict.split(",")] if on_conflict else None
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values):
+        self.mode, self.payload = "update", values
+        return self
+
+    def delete(self):
+        self.mode = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) == 0)
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) != 0)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def ilike(self, column, pattern):
+        regex = re.compile("^" + ".*".join(re.escape(p) for p in pattern.split("%")) + "$", re.IGNORECASE)
+        self.filters.append(lambda row: bool(regex.match(str(row.get(column) or ""))))
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) < 0)
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) <= 0)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) > 0)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: _compare(row.get(column), value) >= 0)
+        return self
+
+    def or_(self, expression):
+        self.filters.append(_parse_or(expression))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.max_rows = count
+        return self
+
+    def single(self):
+        self.single_row = True
+        return self
+
+    # --- execution -----------------------------------------------------
+    def _matches(self, row):
+        return all(f(row) for f in self.filters)
+
+    def _project(self, row):
+        if not self.columns:
+            return dict(row)
+        return {c: row.get(c) for c in self.columns}
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        with self.db.lock:
+            self.db.calls += 1
+            rows = self.db.tables.setdefault(self.table, [])
+            if self.mode == "select":
+                return self._select(rows)
+            payload = self.payload if isinstance(self.payload, list) else [self.payload]
+            if self.mode == "insert":
+                return FakeResponse([self.db.insert(self.table, row) for row in payload])
+            if self.mode == "upsert":
+                return FakeResponse(self._upsert(rows, payload))
+            if self.mode == "update":
+                changed = []
+                for row in rows:
+                    if self._matches(row):
+                        row.update(self.payload)
+                        self.db.generate(self.table, row)
+                        changed.append(dict(row))
+                return FakeResponse(changed)
+            if self.mode == "delete":
+                removed = [row for row in rows if self._matches(row)]
+                rows[:] = [row for row in rows if not self._matches(row)]
+                return FakeResponse(removed)
+        raise ValueError(f"Unsupported query mode {self.mode}")
+
+    def _select(self, rows):
+        found = [row for row in rows if self._matches(row)]
+        for column, desc in reversed(self.orders):
+            found.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.max_rows is not None:
+            found = found[:self.max_rows]
+        found = [self._project(row) for row in found]
+        if self.single_row:
+            if len(found) != 1:
+                raise Exception(f"JSON object requested, multiple (or no) rows returned. "
+                                f"The result contains {len(found)} rows")
+            return FakeResponse(found[0])
+        return FakeResponse(found)
+
+    def _upsert(self, rows, payload):
+        key = self.on_conflict or self.db.primary_keys.get(self.table, ["id"])
+        out = []
+        for new in payload:
+            # Conflict targets may be generated columns, fill them in before matching
+            new = dict(new)
+            self.db.generate(self.table, new)
+            existing = next((row for row in rows if all(row.get(k) == new.get(k) for k in key)), None)
+            if existing is None:
+                out.append(self.db.insert(self.table, new))
+            elif not self.ignore_duplicates:
+                existing.update(new)
+                self.db.generate(self.table, existing)
+                out.append(dict(existing))
+        return out
+
+class FakeRpc:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        time.sleep(self.db.latency)
+        handler = self.db.functions.get(self.name)
+        if handler is None:
+            raise Exception(f"Could not find the function public.{self.name}")
+        with self.db.lock:
+            self.db.calls += 1
+            return FakeResponse(handler(self.db, **self.params))
+
+class FakeSupabase:
+    """Drop-in replacement for supabase.Client, e.g. dbAPI.supabase = FakeSupabase()"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.functions = {"application_stats": _application_stats}
+        self.calls = 0
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.primary_keys = {
+            "applications": ["app_id"],
+            "users": ["email"],
+            "mail_sync_state": ["email"],
+            "monitor_workers": ["worker_id"],
+        }
+
+    def insert(self, table, row):
+        row = dict(row)
+        if table == "applications":
+            row.setdefault("app_id", next(self._ids))
+            row.setdefault("app_date", datetime.now(UTC).isoformat())
+        self.generate(table, row)
+        self.tables.setdefault(table, []).append(row)
+        return dict(row)
+
+    def generate(self, table, row):
+        """Fill in generated columns, like company_key and job_key from migration 006"""
+        if table == "applications":
+            row["company_key"] = _application_key(row.get("company_name"))
+            row["job_key"] = _application_key(row.get("job_title"))
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params or {})
+
+def _application_stats(db, p_email, p_bucket="week"):
+    """Python version of db/migrations/003_application_stats.sql"""
+    counts = Counter()
+    for row in db.tables.get("applications", []):
+        if row.get("email") != p_email:
+            continue
+        day = datetime.fromisoformat(row["app_date"]).replace(hour=0, minute=0, second=0, microsecond=0)
+        if p_bucket == "week":
+            day -= timedelta(days=day.weekday())
+        elif p_bucket == "month":
+            day = day.replace(day=1)
+        counts[(day.isoformat(), row["status"])] += 1
+    return [{"bucket": bucket, "status": status, "applications": n}
+            for (bucket, status), n in sorted(counts.items())]
+
+_KEY_SPACE = re.compile(r'[ \t\n\r\f\v]+')
+
+def _application_key(value):
+    """db/migrations/006_applications_normalized_key.sql: ASCII whitespace collapsed, ASCII letters lower cased"""
+    if not isinstance(value, str):
+        return None
+    return _KEY_SPACE.sub(' ', value).strip(' ').translate(str.maketrans(string.ascii_uppercase, string.ascii_lowercase))
+
+def _compare(a, b):
+    a, b = str(a) if a is not None else "", str(b) if b is not None else ""
+    # Numbers compare numerically, everything else as text (ISO dates sort fine)
+    if a.lstrip("-").isdigit() and b.lstrip("-").isdigit():
+        a, b = int(a), int(b)
+    return (a > b) - (a < b)
+
+def _parse_or(expression):
+    """
+    Support the PostgREST or=(a.lt.x,and(a.eq.x,b.lt.y)) syntax used for keyset
+    paging and natural key matches, including "double quoted" values
+    with backslash escapes
+    """
+    def split(text):
+        parts, depth, current, quoted, escaped = [], 0, "", False, False
+        for c in text:
+            if escaped:
+                escaped = False
+            elif quoted and c == "\\":
+                escaped = True
+            elif c == '"':
+                quoted = not quoted
+            elif not quoted:
+                if c == "," and depth == 0:
+                    parts.append(current)
+                    current = ""
+                    continue
+                depth += c == "("
+                depth -= c == ")"
+            current += c
+        parts.append(current)
+        return parts
+
+    def build(term):
+        if term.startswith("and(") and term.endswith(")"):
+            subs = [build(t) for t in split(term[4:-1])]
+            return lambda row: all(s(row) for s in subs)
+        if term.startswith("or(") and term.endswith(")"):
+            subs = [build(t) for t in split(term[3:-1])]
+            return lambda row: any(s(row) for s in subs)
+        column, op, value = term.split(".", 2)
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = re.sub(r'\\(.)', r'\1', value[1:-1])
+        ops = {
+            "eq": lambda c: c == 0, "neq": lambda c: c != 0,
+            "lt": lambda c: c < 0, "lte": lambda c: c <= 0,
+            "gt": lambda c: c > 0, "gte": lambda c: c >= 0,
+        }
+        return lambda row: ops[op](_compare(row.get(column), value))
+
+    terms = [build(t) for t in split(expression)]
+    return lambda row: any(t(row) for t in terms)
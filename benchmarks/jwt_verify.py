@@ -0,0 +1,62 @@
+"""
+Cost of verifying the API's HS256 access tokens.
+
+Times jwt.decode with python-jose (what dbAPI.py uses), with PyJWT when it
+is installed, and get_current_user with its token cache cold and warm.
+
+    python benchmarks/jwt_verify.py --iterations 20000
+"""
+import time
+import asyncio
+import argparse
+from common import load_db_api, save_results
+
+def per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--save", action="store_true", help="write results to benchmarks/results")
+    args = parser.parse_args()
+
+    dbAPI = load_db_api()
+    from fastapi.security import HTTPAuthorizationCredentials
+    token = dbAPI.create_access_token({"sub": "bench@example.com"})
+    secret, algorithm = dbAPI.JWT_SECRET_KEY, dbAPI.ALGORITHM
+
+    cases = {"python-jose decode": lambda: dbAPI.jwt.decode(token, secret, algorithms=[algorithm])}
+    try:
+        import jwt as pyjwt
+        cases["PyJWT decode"] = lambda: pyjwt.decode(token, secret, algorithms=[algorithm])
+    except ImportError:
+        print("PyJWT not installed, skipping it (pip install pyjwt)")
+
+    loop = asyncio.new_event_loop()
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    def cold():
+        dbAPI.token_cache.entries.clear()
+        loop.run_until_complete(dbAPI.get_current_user(credentials))
+
+    def warm():
+        loop.run_until_complete(dbAPI.get_current_user(credentials))
+
+    cases["get_current_user, cache miss"] = cold
+    cases["get_current_user, cache hit"] = warm
+
+    results = {}
+    for label, fn in cases.items():
+        fn()
+        results[label] = per_call(fn, args.iterations)
+        print(f"{label:<32} {results[label] * 1e6:8.1f} us/call")
+    loop.close()
+
+    if args.save:
+        print(f"Saved {save_results('jwt_verify', results)}")
+
+if __name__ == "__main__":
+    main()
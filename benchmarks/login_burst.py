@@ -0,0 +1,65 @@
+"""
+Read latency of /applications/user/{email} while a burst of /login requests
+is hashing passwords.
+
+Runs the reads alone first, then again next to --logins concurrent logins,
+and prints p50/p99 for both. With bcrypt on the hash queue the p99 of the
+reads should barely move.
+
+    python benchmarks/login_burst.py --logins 50 --reads 200
+"""
+import time
+import asyncio
+import argparse
+from common import load_db_api, summarize, save_results
+
+async def run(app, email, password, logins, reads):
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    read_latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def read():
+            for _ in range(reads // 10):
+                start = time.perf_counter()
+                response = await client.get(f"/applications/user/{email}")
+                response.raise_for_status()
+                read_latencies.append(time.perf_counter() - start)
+
+        async def login():
+            response = await client.post("/login", json={"email": email, "password": password})
+            return response.status_code
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(read() for _ in range(10)), *(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+    statuses = [r for r in results if r is not None]
+    return summarize(read_latencies), statuses, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds per supabase query")
+    parser.add_argument("--save", action="store_true", help="write results to benchmarks/results")
+    args = parser.parse_args()
+
+    dbAPI = load_db_api(latency=args.latency)
+    dbAPI.limiter.enabled = False
+    email, password = "bench@example.com", "benchmark-password"
+    dbAPI.supabase.insert("users", {
+        "email": email, "password": dbAPI.hash_password(password),
+        "Name": "Bench", "Listening": True, "email_app_password": "x",
+    })
+
+    results = {}
+    for label, logins in (("reads only", 0), (f"reads + {args.logins} logins", args.logins)):
+        latency, statuses, elapsed = asyncio.run(run(dbAPI.app, email, password, logins, args.reads))
+        results[label] = {"reads": latency, "login_statuses": sorted(set(statuses)), "elapsed": elapsed}
+        print(f"{label:<24} read p50 {latency['p50'] * 1000:7.1f} ms   "
+              f"p99 {latency['p99'] * 1000:7.1f} ms   wall {elapsed:5.2f} s")
+
+    if args.save:
+        print(f"Saved {save_results('login_burst', results)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Parse time and peak memory per message for the monitor's text extraction.
+
+Every .eml file in --corpus is parsed and its text extracted --repeat times,
+once with the old get_email_content loop (parse the whole message, decode
+every text part as UTF-8) and once the way the monitor does it now:
+email.message_from_bytes, MimeParser.extract_text (first usable text part,
+own charset, size capped) and ContentReducer.reduce_content.
+The fixtures are synthetic, point --corpus at a real export (one .eml per
+message) for numbers that mean something. Peak memory comes from
+tracemalloc on a separate pass, so it doesn't skew the timings.
+
+    python benchmarks/mime_parse.py --corpus ~/exported-mail --repeat 200
+"""
+import os
+import glob
+import time
+import email
+import argparse
+import tracemalloc
+from common import ROOT, SERVER_ENV, add_path, save_results
+
+def legacy_text(msg):
+    """Text extraction as get_email_content did it before MimeParser"""
+    plain_parts, html_parts, errors = [], [], 0
+    for part in msg.walk():
+        if part.get_content_type() in ["text/plain", "text/html"]:
+            try:
+                text = part.get_payload(decode=True).decode()
+                if part.get_content_type() == "text/plain":
+                    plain_parts.append(text)
+                else:
+                    html_parts.append(text)
+            except Exception:
+                errors += 1
+    return plain_parts, html_parts, errors
+
+def measure(fn, raw, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(raw)
+    elapsed = (time.perf_counter() - start) / repeat
+
+    tracemalloc.start()
+    fn(raw)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=os.path.join(ROOT, "benchmarks", "fixtures", "eml"))
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--save", action="store_true", help="write results to benchmarks/results")
+    args = parser.parse_args()
+
+    for key, value in SERVER_ENV.items():
+        os.environ.setdefault(key, value)
+    add_path("server")
+    from MimeParser import extract_text
+    from ContentReducer import reduce_content
+
+    def legacy(raw):
+        return legacy_text(email.message_from_bytes(raw))
+
+    def current(raw):
+        # get_email_content in server/EmailMonitor.py
+        return reduce_content(*extract_text(email.message_from_bytes(raw)))
+
+    paths = sorted(glob.glob(os.path.join(args.corpus, "*.eml")))
+    if not paths:
+        parser.error(f"no .eml files in {args.corpus}")
+
+    results = []
+    print(f"{'message':<36} {'KB':>6} {'old ms':>8} {'new ms':>8} {'old peak KB':>12} {'new peak KB':>12} {'old errors':>10}")
+    for path in paths:
+        with open(path, "rb") as f:
+            raw = f.read()
+        old_time, old_peak, (_, _, errors) = measure(legacy, raw, args.repeat)
+        new_time, new_peak, text = measure(current, raw, args.repeat)
+        name = os.path.basename(path)
+        results.append({
+            "message": name, "bytes": len(raw),
+            "legacy_seconds": old_time, "legacy_peak_bytes": old_peak, "legacy_decode_errors": errors,
+            "seconds": new_time, "peak_bytes": new_peak, "text_chars": len(text),
+        })
+        print(f"{name[:36]:<36} {len(raw) / 1024:>6.0f} {old_time * 1000:>8.3f} {new_time * 1000:>8.3f} "
+              f"{old_peak / 1024:>12.0f} {new_peak / 1024:>12.0f} {errors:>10}")
+
+    total_old = sum(r["legacy_seconds"] for r in results)
+    total_new = sum(r["seconds"] for r in results)
+    print(f"Mean per message: {total_old / len(results) * 1000:.3f} ms before, {total_new / len(results) * 1000:.3f} ms now")
+
+    if args.save:
+        print(f"Saved {save_results('mime_parse', results)}")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,38 @@
 import os
+import re
+import ssl
+import json
+import time
+import uuid
+import base64
 import bcrypt
-import imaplib
+import string
+import asyncio
+import hashlib
+import logging
+import itertools
+import contextvars
 from enum import Enum
-from typing import List
+from collections import defaultdict, OrderedDict
 from slowapi import Limiter
 from dotenv import load_dotenv
 from jose import JWTError, jwt
+from starlette.routing import Match
 from fastapi.middleware import Middleware
-from fastapi.responses import JSONResponse
+from typing import Any, Dict, List, Literal, Optional
 from supabase import create_client, Client
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime, timedelta, UTC
 from slowapi.middleware import SlowAPIMiddleware
+from concurrent.futures import ThreadPoolExecutor
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel, validator, ValidationError
-from fastapi import FastAPI, HTTPException, Security, Request
+from fastapi import FastAPI, HTTPException, Security, Request, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
 
 load_dotenv()
 
@@ -25,12 +41,30 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY')
 FRONTEND_URL = os.getenv('FRONTEND_URL')
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '32'))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', str(os.cpu_count() or 2)))
+HASH_QUEUE_LIMIT = int(os.getenv('HASH_QUEUE_LIMIT', '64'))
+IMAP_VALIDATION_HOST = os.getenv('IMAP_VALIDATION_HOST', 'imap.gmail.com')
+IMAP_VALIDATION_PORT = int(os.getenv('IMAP_VALIDATION_PORT', '993'))
+IMAP_VALIDATION_SSL = os.getenv('IMAP_VALIDATION_SSL', 'true').lower() == 'true'
+IMAP_VALIDATION_TIMEOUT = float(os.getenv('IMAP_VALIDATION_TIMEOUT', '10'))
+IMAP_VALIDATION_CACHE_TTL = int(os.getenv('IMAP_VALIDATION_CACHE_TTL', '300'))
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', '100'))
+STREAM_HEARTBEAT = float(os.getenv('STREAM_HEARTBEAT', '15'))
+STREAM_MAX_PER_USER = int(os.getenv('STREAM_MAX_PER_USER', '5'))
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '60'))
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '1024'))
+MONITOR_LEASE_TTL = int(os.getenv('MONITOR_LEASE_TTL', '180'))
+STREAM_TICKET_TTL = int(os.getenv('STREAM_TICKET_TTL', '30'))
 
 #env validation
 if not all([SUPABASE_URL, SUPABASE_KEY, JWT_SECRET_KEY, FRONTEND_URL]):
     raise ValueError("Missing required environment variables. Please check your .env file.")
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# The supabase client is synchronous, its calls run here instead of on the event loop
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="supabase")
 limiter = Limiter(key_func=get_remote_address)
 app = FastAPI(title="Job Tracker API")
 app.state.limiter = limiter
@@ -43,14 +77,77 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["ETag", "X-Next-Cursor", "X-Trace-Id"],
 )
 
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+REQUEST_SECONDS = Histogram(
+    'api_request_seconds', 'Request latency by route template', ['method', 'route', 'status'],
+    buckets=SECONDS_BUCKETS
+)
+SUPABASE_SECONDS = Histogram(
+    'api_supabase_seconds', 'Supabase call latency by the route that made it', ['route'],
+    buckets=SECONDS_BUCKETS
+)
+SUPABASE_ERRORS = Counter('api_supabase_errors_total', 'Failed Supabase calls by route', ['route'])
+
+# Route template and trace id of the request being handled
+current_route = contextvars.ContextVar("route", default="-")
+current_trace = contextvars.ContextVar("trace_id", default="-")
+
+def route_template(scope):
+    """'/applications/user/{email}' rather than the raw path, so labels stay few"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Time every request by route and tag it with the caller's trace id (or a new one)"""
+    trace_id = request.headers.get(TRACE_HEADER) or uuid.uuid4().hex[:16]
+    route = route_template(request.scope)
+    current_trace.set(trace_id)
+    current_route.set(route)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers[TRACE_HEADER] = trace_id
+        return response
+    finally:
+        REQUEST_SECONDS.labels(request.method, route, str(status)).observe(time.perf_counter() - start)
+
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 SIGNUP_LIM = 12
 LOGIN_LIM = 12
 VERIFY_LIM = 100
 security = HTTPBearer()
+# EventSource can't set headers, so the stream also takes a ?ticket=
+stream_security = HTTPBearer(auto_error=False)
+
+async def run_query(query):
+    """Execute a supabase query on the db thread pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    route = current_route.get()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(db_executor, query.execute)
+    except Exception:
+        SUPABASE_ERRORS.labels(route).inc()
+        raise
+    finally:
+        SUPABASE_SECONDS.labels(route).observe(time.perf_counter() - start)
 
 #acsess token
 def create_access_token(data: dict):
@@ -60,15 +157,92 @@ def create_access_token(data: dict):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+class TokenCache:
+    """
+    LRU of tokens that already passed jwt.decode, keyed by their sha256 so
+    raw tokens aren't kept around. An entry is only used until the token's exp.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def get(self, token):
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        email, expires = entry
+        if expires <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return email
+
+    def put(self, token, email, expires):
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        self.entries[key] = (email, expires)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+token_cache = TokenCache(TOKEN_CACHE_SIZE)
+
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     try:
         token = credentials.credentials
+        email = token_cache.get(token)
+        if email is not None:
+            return email
         payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
         email = str(payload["sub"])  # Will raise KeyError if "sub" doesn't exist
+        # Tokens without an exp are still accepted, just never cached
+        if "exp" in payload:
+            token_cache.put(token, email, float(payload["exp"]))
         return email
     except (JWTError, KeyError):
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
 
+class StreamTickets:
+    """
+    Short lived, single use tickets for opening /applications/stream from a
+    browser. They stand in for the access token in the URL, where proxies
+    and access logs would keep it. Tickets are signed JWTs for the stream
+    audience, so any API worker can check one and an access token check
+    rejects them; used ones are remembered in this process until they expire.
+    """
+
+    audience = "applications-stream"
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.used = {}
+
+    def issue(self, email):
+        claims = {"sub": email, "aud": self.audience, "jti": uuid.uuid4().hex, "exp": int(time.time()) + self.ttl}
+        return jwt.encode(claims, JWT_SECRET_KEY, algorithm=ALGORITHM)
+
+    def redeem(self, ticket):
+        """Return the ticket's email, or raise 401 if it is invalid, expired or already used"""
+        try:
+            payload = jwt.decode(ticket, JWT_SECRET_KEY, algorithms=[ALGORITHM], audience=self.audience)
+            # Access tokens carry no aud, which decode lets through
+            if payload.get("aud") != self.audience or not payload.get("jti"):
+                raise JWTError("Not a stream ticket")
+            email = str(payload["sub"])
+        except (JWTError, KeyError):
+            raise HTTPException(status_code=401, detail="Invalid stream ticket")
+
+        now = time.time()
+        for jti in [jti for jti, expires in self.used.items() if expires <= now]:
+            del self.used[jti]
+        if payload["jti"] in self.used:
+            raise HTTPException(status_code=401, detail="Stream ticket already used")
+        self.used[payload["jti"]] = float(payload["exp"])
+        return email
+
+stream_tickets = StreamTickets(STREAM_TICKET_TTL)
+
 # Create Enum class to match database ENUM
 class ApplicationStatus(str, Enum):
     PENDING_RESPONSE = "Pending Response"
@@ -83,11 +257,133 @@ class Application(BaseModel):
     job_title: str
     status: ApplicationStatus = ApplicationStatus.PENDING_RESPONSE
 
-class ApplicationResponse(BaseModel):
+class ApplicationStatusUpdate(BaseModel):
+    email: str
     company_name: str
     job_title: str
     status: ApplicationStatus
-    app_date: datetime
+    create_missing: bool = False
+
+# Applications are unique on (email, company_key, job_key), the normalized names
+NATURAL_KEY = "email,company_key,job_key"
+
+_KEY_SPACE = re.compile(r'[ \t\n\r\f\v]+')
+_KEY_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def application_key(value: str) -> str:
+    """
+    The application_key SQL function (db/migrations/006_applications_normalized_key.sql):
+    ASCII whitespace collapsed and trimmed, ASCII letters lower cased
+    """
+    return _KEY_SPACE.sub(' ', value).strip(' ').translate(_KEY_LOWER)
+
+def natural_key(row):
+    return (row["email"], application_key(row["company_name"]), application_key(row["job_title"]))
+
+# Fields are optional so callers can ask for a subset with ?fields=
+class ApplicationResponse(BaseModel):
+    app_id: Optional[int] = None
+    company_name: Optional[str] = None
+    job_title: Optional[str] = None
+    status: Optional[ApplicationStatus] = None
+    app_date: Optional[datetime] = None
+
+APPLICATION_FIELDS = ["app_id", "company_name", "job_title", "status", "app_date"]
+DEFAULT_APPLICATION_FIELDS = ["company_name", "job_title", "status", "app_date"]
+MAX_PAGE_SIZE = 500
+
+def _filter_value(value):
+    """Quote a value for a PostgREST or=() filter"""
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def encode_cursor(row):
+    raw = json.dumps([row["app_date"], row["app_id"]]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(cursor: str):
+    try:
+        app_date, app_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        # Cursors come from the client, only a real timestamp goes into the filter
+        datetime.fromisoformat(app_date)
+        return app_date, int(app_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+class ApplicationBroker:
+    """
+    Fans application writes out to the dashboards streaming them. Subscribers
+    are kept per user email in this process, so every API worker only pushes
+    the writes it handled itself: run the API as a single worker (as
+    __main__ does) or dashboards on one worker miss writes made on another.
+    """
+
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscribers = defaultdict(set)
+        self.event_ids = itertools.count(1)
+
+    def subscribe(self, email):
+        if len(self.subscribers[email]) >= STREAM_MAX_PER_USER:
+            raise HTTPException(status_code=429, detail="Too many open streams")
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[email].add(queue)
+        return queue
+
+    def unsubscribe(self, email, queue):
+        self.subscribers[email].discard(queue)
+        if not self.subscribers[email]:
+            del self.subscribers[email]
+
+    def publish(self, event, rows):
+        for row in rows:
+            queues = self.subscribers.get(row.get("email"))
+            if not queues:
+                continue
+            data = jsonable_encoder(ApplicationResponse(**{f: row.get(f) for f in APPLICATION_FIELDS}))
+            message = (next(self.event_ids), event, data)
+            for queue in queues:
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # The client fell behind, drop its backlog and have it refetch
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait((message[0], "resync", None))
+
+broker = ApplicationBroker(STREAM_QUEUE_SIZE)
+
+class StatsCache:
+    """
+    Per user stats summaries, kept for ttl seconds or until one of the
+    user's applications is written
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.entries = {}
+
+    def get(self, email, bucket):
+        entry = self.entries.get((email, bucket))
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def put(self, email, bucket, stats):
+        self.entries[(email, bucket)] = (time.monotonic() + self.ttl, stats)
+
+    def invalidate(self, rows):
+        emails = {row.get("email") for row in rows}
+        for key in [key for key in self.entries if key[0] in emails]:
+            del self.entries[key]
+
+stats_cache = StatsCache(STATS_CACHE_TTL)
+
+def applications_changed(event, rows):
+    """Called after every application write with the rows it returned"""
+    if not rows:
+        return
+    stats_cache.invalidate(rows)
+    broker.publish(event, rows)
 
 @app.exception_handler(RateLimitExceeded)
 async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
@@ -96,42 +392,197 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
         content={"detail": "Too many requests. Please try again later."}
     )
 
-#get All aps of user
+#get All aps of user, newest first, optionally one keyset page at a time
 @app.get("/applications/user/{email}", response_model=List[ApplicationResponse])
-async def get_user_applications(email: str):
+async def get_user_applications(
+    request: Request,
+    email: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[ApplicationStatus] = None,
+    company: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """
+    Without limit every application is returned, as before. With limit the
+    X-Next-Cursor header holds the cursor for the following page. Responses
+    carry an ETag and an unchanged list is answered with 304 Not Modified.
+    """
     try:
-        response = supabase.table('applications')\
-            .select("company_name,job_title,status,app_date")\
-            .eq("email", email)\
-            .order("app_date", desc=True)\
-            .execute()
+        selected = DEFAULT_APPLICATION_FIELDS
+        if fields:
+            selected = [f.strip() for f in fields.split(",") if f.strip()]
+            unknown = set(selected) - set(APPLICATION_FIELDS)
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
 
-        if not response.data:
-            return []
+        # The keyset columns are always read so the next cursor can be built
+        columns = list(dict.fromkeys(selected + ["app_date", "app_id"]))
+        query = supabase.table('applications')\
+            .select(",".join(columns))\
+            .eq("email", email)
+
+        if status:
+            query = query.eq("status", status.value)
+        if company:
+            query = query.ilike("company_name", f"%{company}%")
+        if cursor:
+            app_date, app_id = decode_cursor(cursor)
+            app_date = _filter_value(app_date)
+            query = query.or_(f'app_date.lt.{app_date},and(app_date.eq.{app_date},app_id.lt.{app_id})')
+
+        query = query.order("app_date", desc=True).order("app_id", desc=True)
+        if limit:
+            # One extra row tells us whether there is another page
+            query = query.limit(limit + 1)
+
+        response = await run_query(query)
+        rows = response.data or []
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1])
+
+        body = [
+            jsonable_encoder(ApplicationResponse(**{f: row.get(f) for f in selected}), exclude_unset=True)
+            for row in rows
+        ]
+
+        digest = hashlib.sha256(json.dumps([body, next_cursor], sort_keys=True).encode('utf-8')).hexdigest()
+        headers = {"ETag": f'W/"{digest[:32]}"', "Cache-Control": "private, no-cache"}
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+
+        if request.headers.get("if-none-match") == headers["ETag"]:
+            return Response(status_code=304, headers=headers)
+        return JSONResponse(content=body, headers=headers)
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+#counts by status over time plus the response funnel, aggregated in the database
+@app.get("/applications/user/{email}/stats")
+async def get_user_application_stats(email: str, bucket: Literal["day", "week", "month"] = "week"):
+    """
+    Grouping happens in the application_stats SQL function (see
+    db/migrations/003_application_stats.sql), so only one row per
+    (bucket, status) comes back however long the history is.
+    """
+    cached = stats_cache.get(email, bucket)
+    if cached is not None:
+        return cached
+
+    try:
+        response = await run_query(supabase.rpc('application_stats', {
+            "p_email": email,
+            "p_bucket": bucket
+        }))
+
+        by_status = {status.value: 0 for status in ApplicationStatus}
+        timeline = {}
+        for row in response.data or []:
+            count = int(row["applications"])
+            by_status[row["status"]] = by_status.get(row["status"], 0) + count
+            counts = timeline.setdefault(row["bucket"], {})
+            counts[row["status"]] = counts.get(row["status"], 0) + count
 
-        return response.data
+        total = sum(by_status.values())
+        pending = by_status[ApplicationStatus.PENDING_RESPONSE.value]
+        offers = by_status[ApplicationStatus.OFFER_RECEIVED.value]
+        interviews = offers \
+            + by_status[ApplicationStatus.INTERVIEW_SCHEDULED.value] \
+            + by_status[ApplicationStatus.TALK_SCHEDULED.value]
+
+        stats = {
+            "bucket": bucket,
+            "total": total,
+            "by_status": by_status,
+            "timeline": [{"bucket": key, "counts": timeline[key]} for key in sorted(timeline)],
+            "funnel": [
+                {"stage": "Applied", "count": total},
+                {"stage": "Responded", "count": total - pending},
+                {"stage": "Interview", "count": interviews},
+                {"stage": "Offer", "count": offers},
+            ],
+            "response_rate": (total - pending) / total if total else 0.0,
+        }
+        stats_cache.put(email, bucket, stats)
+        return stats
 
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+#one time ticket for opening the stream, so the access token stays out of URLs
+@app.post("/applications/stream/ticket")
+async def create_stream_ticket(credentials: HTTPAuthorizationCredentials = Security(security)):
+    email = await get_current_user(credentials)
+    return {"ticket": stream_tickets.issue(email), "expires_in": STREAM_TICKET_TTL}
+
+#stream application inserts and status changes for the signed in user
+@app.get("/applications/stream")
+async def stream_applications(
+    request: Request,
+    ticket: Optional[str] = None,
+    credentials: Optional[HTTPAuthorizationCredentials] = Security(stream_security)
+):
+    """
+    Server-Sent Events: "created" and "updated" carry the application row,
+    "resync" means events were dropped and the list should be refetched.
+    Browsers pass a ?ticket= from POST /applications/stream/ticket, other
+    clients can send their access token as a Bearer header. Only writes
+    handled by this API process are streamed, see ApplicationBroker.
+    """
+    if credentials is not None:
+        email = await get_current_user(credentials)
+    elif ticket:
+        email = stream_tickets.redeem(ticket)
+    else:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    queue = broker.subscribe(email)
+
+    async def events():
+        try:
+            # Browsers reconnect after 5s if the connection drops
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event_id, event, data = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            broker.unsubscribe(email, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 #get applications
 @app.get("/applications")
 async def get_application_id(email: str, company_name: str, job_title: str):
     try:
-        response = supabase.table('applications')\
-            .select("app_id")\
-            .eq("email", email)\
-            .eq("company_name", company_name)\
-            .eq("job_title", job_title)\
-            .single().execute()
-
-        if 'details' in str(response) and 'The result contains 0 rows' in str(response):
-            raise HTTPException(status_code=404, detail="Application not found")
+        # Normalized names match however the classifier spelled them
+        response = await run_query(supabase.table('applications')
+            .select("app_id")
+            .eq("email", email)
+            .eq("company_key", application_key(company_name))
+            .eq("job_key", application_key(job_title))
+            .limit(1))
 
         if not response.data:
             raise HTTPException(status_code=404, detail="Application not found")
 
-        return response.data['app_id']
+        return response.data[0]['app_id']
+    except HTTPException as he:
+        raise he
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -139,13 +590,14 @@ async def get_application_id(email: str, company_name: str, job_title: str):
 @app.post("/applications")
 async def create_application(application: Application):
     try:
-        response = supabase.table('applications').insert({
+        response = await run_query(supabase.table('applications').insert({
             "email": application.email,
             "company_name": application.company_name,
             "job_title": application.job_title,
             "status": application.status
-        }).execute()
+        }))
 
+        applications_changed("created", response.data)
         return response.data[0]
     except Exception as e:
         # Check if error message contains foreign key violation
@@ -156,24 +608,225 @@ async def create_application(application: Application):
             )
         raise HTTPException(status_code=400, detail=str(e))
 
+#update application status by (email, company_name, job_title), names match normalized
+@app.put("/applications/status")
+async def update_application_status_by_key(update: ApplicationStatusUpdate):
+    def set_status():
+        # Only the status changes, the stored names keep their spelling
+        return (supabase.table('applications')
+            .update({
+                "status": update.status.value
+            })
+            .eq("email", update.email)
+            .eq("company_key", application_key(update.company_name))
+            .eq("job_key", application_key(update.job_title)))
+
+    try:
+        event = "updated"
+        response = await run_query(set_status())
+        if not response.data and update.create_missing:
+            # Never tracked, insert it; if another request just did, update that row
+            response = await run_query(supabase.table('applications')
+                .upsert({
+                    "email": update.email,
+                    "company_name": update.company_name,
+                    "job_title": update.job_title,
+                    "status": update.status.value
+                }, on_conflict=NATURAL_KEY, ignore_duplicates=True)
+            )
+            if response.data:
+                event = "created"
+            else:
+                response = await run_query(set_status())
+
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Application not found")
+
+        applications_changed(event, response.data)
+        return response.data[0]
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        if "violates foreign key constraint" in str(e):
+            raise HTTPException(
+                status_code=409,
+                detail="Email does not exist in users table"
+            )
+        raise HTTPException(status_code=400, detail=str(e))
+
 #update application row, givin Application obj
 @app.put("/applications/{app_id}")
 async def update_application_status(app_id: int, status_update: ApplicationStatus):
     try:
-        response = supabase.table('applications')\
+        response = await run_query(supabase.table('applications')
             .update({
                 "status": status_update.value
-            })\
-            .eq("app_id", app_id)\
-            .execute()
+            })
+            .eq("app_id", app_id)
+        )
 
         if not response.data:
             raise HTTPException(status_code=404, detail="Application not found")
 
+        applications_changed("updated", response.data)
         return response.data[0]
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+class ApplicationOperation(BaseModel):
+    op: Literal["create", "update_status"]
+    email: str
+    company_name: str
+    job_title: str
+    status: ApplicationStatus = ApplicationStatus.PENDING_RESPONSE
+    create_missing: bool = False
+    trace_id: Optional[str] = None  # the monitor's id for the email behind this operation
+
+class BulkApplicationRequest(BaseModel):
+    # Validated one at a time, so a malformed operation only fails itself
+    operations: List[Dict[str, Any]]
+
+BULK_MATCH_CHUNK = 50  # key tuples per existence query, keeps the URL short
+
+def natural_key_filter(keys):
+    """or=() filter matching exactly these (email, company_key, job_key) tuples"""
+    return ",".join(
+        f"and(email.eq.{_filter_value(email)},company_key.eq.{_filter_value(company)},"
+        f"job_key.eq.{_filter_value(title)})"
+        for email, company, title in keys
+    )
+
+def bulk_error(e):
+    if "violates foreign key constraint" in str(e):
+        return "Email does not exist in users table"
+    return str(e)
+
+def is_row_error(e):
+    """Postgres data (22xxx) and constraint (23xxx) errors come from a row, not the request"""
+    return str(getattr(e, "code", "") or "")[:2] in ("22", "23")
+
+async def upsert_applications(rows, errors, **kwargs):
+    """
+    Upsert rows with one request. When a row is rejected they are retried
+    one by one, so only the bad rows fail; their errors go into errors by
+    natural key. Returns the rows written.
+    """
+    try:
+        response = await run_query(supabase.table('applications').upsert(rows, **kwargs))
+        return response.data or []
+    except Exception as e:
+        if not is_row_error(e):
+            raise
+        if len(rows) == 1:
+            errors[natural_key(rows[0])] = bulk_error(e)
+            return []
+        logger.warning(f"Bulk upsert of {len(rows)} applications rejected, retrying row by row: {str(e)}")
+    written = []
+    for row in rows:
+        written.extend(await upsert_applications([row], errors, **kwargs))
+    return written
+
+def log_bulk_traces(operations, results):
+    """One line tying each traced email to what happened to its application"""
+    traced = [
+        f"{operation.trace_id}={results[i]['status']}"
+        for i, operation in operations if operation.trace_id
+    ]
+    if traced:
+        logger.info(f"trace={current_trace.get()} bulk of {len(operations)}: {', '.join(traced)}")
+
+#apply many creates/status updates at once, keyed on (email, company_key, job_key)
+@app.post("/applications/bulk")
+async def bulk_upsert_applications(bulk: BulkApplicationRequest):
+    """
+    results lines up with the operations: created, updated, unchanged (a
+    create for an application that exists), missing (an update_status with
+    nothing to update) or failed with an error. Clients retry only the
+    failed ones.
+    """
+    try:
+        results = [None] * len(bulk.operations)
+        operations = []
+        for i, raw in enumerate(bulk.operations):
+            try:
+                operations.append((i, ApplicationOperation(**raw)))
+            except ValidationError as e:
+                results[i] = {"status": "failed", "error": str(e)}
+
+        # Later operations on the same application win
+        creates, updates, upsert_keys = {}, {}, set()
+        for _, operation in operations:
+            row = {
+                "email": operation.email,
+                "company_name": operation.company_name,
+                "job_title": operation.job_title,
+                "status": operation.status.value
+            }
+            if operation.op == "create":
+                creates[natural_key(row)] = row
+            else:
+                updates[natural_key(row)] = row
+                if operation.create_missing:
+                    upsert_keys.add(natural_key(row))
+                else:
+                    upsert_keys.discard(natural_key(row))
+
+        # Updates for applications created in the same batch, or flagged
+        # create_missing, may insert the row, spelled as the create had it
+        may_insert = (set(creates) & set(updates)) | upsert_keys
+        for key in may_insert:
+            create = creates.pop(key, None)
+            if create:
+                updates[key].update(company_name=create["company_name"], job_title=create["job_title"])
+
+        created, updated, missing, errors = [], [], [], {}
+
+        if creates:
+            # New applications only, existing ones keep their current status
+            created = await upsert_applications(
+                list(creates.values()), errors, on_conflict=NATURAL_KEY, ignore_duplicates=True
+            )
+
+        if updates:
+            # Stored names by key, an update only changes the status of a row
+            # however the classifier spelled its names this time
+            keys, existing = list(updates), {}
+            for start in range(0, len(keys), BULK_MATCH_CHUNK):
+                response = await run_query(supabase.table('applications')
+                    .select("email,company_name,job_title")
+                    .or_(natural_key_filter(keys[start:start + BULK_MATCH_CHUNK]))
+                )
+                existing.update((natural_key(row), row) for row in response.data or [])
+
+            rows = []
+            for key, row in updates.items():
+                if key in existing:
+                    rows.append({**row, **existing[key]})
+                elif key in may_insert:
+                    rows.append(row)
+                else:
+                    missing.append(row)
+
+            if rows:
+                updated = await upsert_applications(rows, errors, on_conflict=NATURAL_KEY)
+
+        outcomes = {}
+        for outcome, rows in (("created", created), ("updated", updated), ("missing", missing)):
+            outcomes.update((natural_key(row), outcome) for row in rows)
+        for i, operation in operations:
+            key = (operation.email, application_key(operation.company_name), application_key(operation.job_title))
+            if key in errors:
+                results[i] = {"status": "failed", "error": errors[key]}
+            else:
+                results[i] = {"status": outcomes.get(key, "unchanged")}
+
+        applications_changed("created", created)
+        applications_changed("updated", updated)
+        log_bulk_traces(operations, results)
+        return {"created": created, "updated": updated, "missing": missing, "results": results}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 ##-------------Users table endpoints-------------------
 
 class User(BaseModel):
@@ -209,10 +862,33 @@ class LoginResponse(BaseModel):
     token_type: str
     user: UserResponse
 
+class HashQueue:
+    """
+    Runs bcrypt on its own threads (bcrypt releases the GIL) so hashing never
+    blocks the event loop, and turns requests away once limit jobs are queued
+    """
+
+    def __init__(self, workers, limit):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self.limit = limit
+        self.pending = 0
+
+    async def run(self, fn, *args):
+        if self.pending >= self.limit:
+            raise HTTPException(status_code=503, detail="Server busy. Please try again shortly.")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+hash_queue = HashQueue(HASH_WORKERS, HASH_QUEUE_LIMIT)
+
 #Hash Pass
 def hash_password(password: str) -> str:
     # Generate a salt and hash the password
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')  # Convert bytes to string for storage
 
@@ -223,25 +899,73 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode('utf-8')
     )
 
-def validate_email_credentials(email, password):
-    """
-    Validate email credentials by attempting to connect to Gmail
-    Returns True if credentials are valid, False otherwise
-    """
+def _imap_quote(value: str) -> bytes:
+    # Same quoting imaplib uses for LOGIN arguments
+    return b'"' + value.replace('\\', '\\\\').replace('"', '\\"').encode('utf-8') + b'"'
+
+async def _imap_login(email: str, password: str) -> bool:
+    """Log in and out over asyncio streams, True when the server accepts the login"""
+    ssl_context = ssl.create_default_context() if IMAP_VALIDATION_SSL else None
+    reader, writer = await asyncio.open_connection(IMAP_VALIDATION_HOST, IMAP_VALIDATION_PORT, ssl=ssl_context)
     try:
-        # Try to establish connection
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(email, password)
+        greeting = await reader.readline()
+        if not greeting.startswith(b"* OK"):
+            raise ConnectionError(f"Unexpected IMAP greeting: {greeting!r}")
+
+        writer.write(b"a1 LOGIN " + _imap_quote(email) + b" " + _imap_quote(password) + b"\r\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("IMAP server closed the connection")
+            if line.startswith(b"a1 "):
+                accepted = line[3:].upper().startswith(b"OK")
+                break
+
+        if accepted:
+            writer.write(b"a2 LOGOUT\r\n")
+            await writer.drain()
+        return accepted
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
 
-        # If login successful, logout and return True
-        imap.logout()
+def _credentials_key(email: str, password: str) -> str:
+    return hashlib.sha256(f"{email}\0{password}".encode('utf-8')).hexdigest()
+
+# digest of (email, app password) -> time the successful check expires
+validated_credentials = {}
+
+async def validate_email_credentials(email, password):
+    """
+    Validate email credentials by attempting to log in to the IMAP server
+    with a hard timeout. Recent successful checks are cached so a retried
+    signup skips the TLS handshake. Raises HTTPException when invalid.
+    """
+    key = _credentials_key(email, password)
+    now = time.monotonic()
+    if validated_credentials.get(key, 0) > now:
         return True
 
-    except imaplib.IMAP4.error:
-        raise HTTPException(status_code=422, detail="Invalid credentials")
+    try:
+        accepted = await asyncio.wait_for(_imap_login(email, password), IMAP_VALIDATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Email server did not respond in time")
     except Exception:
         raise HTTPException(status_code=422, detail="Invalid credentials")
 
+    if not accepted:
+        raise HTTPException(status_code=422, detail="Invalid credentials")
+
+    # Drop expired entries before adding, the cache only lives for minutes
+    for stale in [k for k, expires in validated_credentials.items() if expires <= now]:
+        del validated_credentials[stale]
+    validated_credentials[key] = now + IMAP_VALIDATION_CACHE_TTL
+    return True
+
 #create a user
 @app.post("/signup")
 @limiter.limit(f'{SIGNUP_LIM}/hour')
@@ -249,10 +973,10 @@ async def create_user(request: Request, user: UserCreate):
     try:
 
         #first check if info is valid
-        validate_email_credentials(user.email,user.email_app_password)
+        await validate_email_credentials(user.email,user.email_app_password)
 
         # Hash the password before storing
-        hashed_password = hash_password(user.password)
+        hashed_password = await hash_queue.run(hash_password, user.password)
 
         # Create user data with hashed passwords
         user_data = {
@@ -264,7 +988,7 @@ async def create_user(request: Request, user: UserCreate):
         }
 
         # Insert the user into the database
-        result = supabase.table('users').insert(user_data).execute()
+        result = await run_query(supabase.table('users').insert(user_data))
 
         # Create access token
         access_token = create_access_token(
@@ -286,6 +1010,8 @@ async def create_user(request: Request, user: UserCreate):
             raise HTTPException(status_code=400, detail="Failed to create user")
 
 
+    except HTTPException as he:
+        raise he
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=str(ve))
     except Exception as e:
@@ -302,15 +1028,18 @@ async def create_user(request: Request, user: UserCreate):
 
 #get all users
 @app.get("/users", response_model=List[User])
-async def get_all_users():
+async def get_all_users(listening: Optional[bool] = None):
     try:
-        # Fetch all users from the database
-        response = supabase.table('users').select(
+        # Fetch all users from the database, or only those with Listening set as asked
+        query = supabase.table('users').select(
             'Name',
             'email',
             'Listening',
             'email_app_password'
-        ).execute()
+        )
+        if listening is not None:
+            query = query.eq('Listening', listening)
+        response = await run_query(query)
 
         if response.data:
             # Transform the data to match the User model
@@ -337,13 +1066,13 @@ async def get_all_users():
 async def get_user(request: Request, user_login: UserLogin):
     try:
         # Fetch user from database by email
-        response = supabase.table('users').select(
+        response = await run_query(supabase.table('users').select(
             'Name',
             'email',
             'password',
             'Listening',
             'email_app_password'
-        ).eq('email', user_login.email).execute()
+        ).eq('email', user_login.email))
 
         # Check if user exists
         if not response.data:
@@ -352,7 +1081,7 @@ async def get_user(request: Request, user_login: UserLogin):
         user = response.data[0]
 
         # Verify password
-        if not verify_password(user_login.password, user['password']):
+        if not await hash_queue.run(verify_password, user_login.password, user['password']):
             raise HTTPException(status_code=401, detail="Invalid password or Email")
 
         # Create access token
@@ -376,9 +1105,105 @@ async def get_user(request: Request, user_login: UserLogin):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+##-------------Mail sync state endpoints-------------------
+
+class SyncState(BaseModel):
+    uid_validity: int
+    last_uid: int
+
+#get the monitor's IMAP high-water mark for a user
+@app.get("/users/{email}/sync-state", response_model=SyncState)
+async def get_sync_state(email: str):
+    try:
+        response = await run_query(supabase.table('mail_sync_state')
+            .select("uid_validity,last_uid")
+            .eq("email", email)
+        )
+
+        if not response.data:
+            raise HTTPException(status_code=404, detail="Sync state not found")
+
+        return response.data[0]
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+#store the monitor's IMAP high-water mark for a user
+@app.put("/users/{email}/sync-state", response_model=SyncState)
+async def update_sync_state(email: str, state: SyncState):
+    try:
+        response = await run_query(supabase.table('mail_sync_state').upsert({
+            "email": email,
+            "uid_validity": state.uid_validity,
+            "last_uid": state.last_uid,
+            "updated_at": datetime.now(UTC).isoformat()
+        }))
+
+        return response.data[0]
+    except Exception as e:
+        if "violates foreign key constraint" in str(e):
+            raise HTTPException(
+                status_code=409,
+                detail="Email does not exist in users table"
+            )
+        raise HTTPException(status_code=400, detail=str(e))
+
+##-------------Monitor worker endpoints-------------------
+
+class WorkerLease(BaseModel):
+    worker_id: str
+    workers: List[str]
+    lease_seconds: int
+
+#renew a monitor worker's lease and return every worker that holds one
+@app.put("/monitor/workers/{worker_id}", response_model=WorkerLease)
+async def heartbeat_worker(worker_id: str):
+    """
+    Workers renew their lease here from a background thread every
+    lease_seconds / 3 (MONITOR_LEASE_TTL / 3), whatever their sweeps are
+    doing, and split users among the returned list. A worker that stops
+    calling drops out after MONITOR_LEASE_TTL.
+    """
+    try:
+        now = datetime.now(UTC)
+        await run_query(supabase.table('monitor_workers').upsert({
+            "worker_id": worker_id,
+            "heartbeat_at": now.isoformat()
+        }))
+
+        cutoff = now - timedelta(seconds=MONITOR_LEASE_TTL)
+        response = await run_query(supabase.table('monitor_workers')
+            .select("worker_id")
+            .gte("heartbeat_at", cutoff.isoformat())
+        )
+
+        workers = sorted({row["worker_id"] for row in response.data or []} | {worker_id})
+        return {"worker_id": worker_id, "workers": workers, "lease_seconds": MONITOR_LEASE_TTL}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+#give up a monitor worker's lease on shutdown so its users move right away
+@app.delete("/monitor/workers/{worker_id}")
+async def release_worker(worker_id: str):
+    try:
+        await run_query(supabase.table('monitor_workers')
+            .delete()
+            .eq("worker_id", worker_id)
+        )
+        return {"worker_id": worker_id, "released": True}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 #----------------------Others-------------------------
 
 
+#Prometheus metrics of this worker process
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/verify-token")
 @limiter.limit(f'{VERIFY_LIM}/hour')
 async def verify_token(request: Request, credentials: HTTPAuthorizationCredentials = Security(security)):
@@ -390,4 +1215,5 @@ async def verify_token(request: Request, credentials: HTTPAuthorizationCredentia
 
 if __name__ == "__main__":
     import uvicorn
+    # One worker: the stream broker and ticket replay check live in this process
     uvicorn.run(app, host="0.0.0.0", port=8000)
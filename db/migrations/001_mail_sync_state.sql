@@ -0,0 +1,10 @@
+-- Per-user IMAP high-water mark for the monitor's incremental UID sync.
+-- A row is only valid while uid_validity matches the mailbox; when it
+-- changes the monitor resyncs from unread mail and overwrites the row.
+
+create table if not exists mail_sync_state (
+    email        text primary key references users (email) on delete cascade,
+    uid_validity bigint not null,
+    last_uid     bigint not null default 0,
+    updated_at   timestamptz not null default now()
+);
@@ -0,0 +1,13 @@
+-- An application is identified by (email, company_name, job_title).
+-- POST /applications/bulk upserts on this key, which needs a unique index.
+
+-- Keep the newest row of any duplicates created before the index existed
+delete from applications a
+using applications b
+where a.email = b.email
+  and a.company_name = b.company_name
+  and a.job_title = b.job_title
+  and a.app_id < b.app_id;
+
+create unique index if not exists applications_natural_key_idx
+    on applications (email, company_name, job_title);
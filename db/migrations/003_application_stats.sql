@@ -0,0 +1,17 @@
+-- Per user application counts grouped by status and time bucket, used by
+-- GET /applications/user/{email}/stats. p_bucket is any date_trunc unit,
+-- the API passes day, week or month.
+
+create or replace function application_stats(p_email text, p_bucket text default 'week')
+returns table (bucket timestamptz, status text, applications bigint)
+language sql
+stable
+as $$
+    select date_trunc(p_bucket, app_date) as bucket,
+           status::text as status,
+           count(*) as applications
+    from applications
+    where email = p_email
+    group by 1, 2
+    order by 1, 2;
+$$;
@@ -0,0 +1,12 @@
+-- Leases of the running monitor workers. Each worker renews its row through
+-- PUT /monitor/workers/{worker_id} from a background thread every
+-- MONITOR_LEASE_TTL / 3 seconds, independent of its sweeps, and users are
+-- split among the workers whose heartbeat is younger than MONITOR_LEASE_TTL.
+
+create table if not exists monitor_workers (
+    worker_id    text primary key,
+    heartbeat_at timestamptz not null default now()
+);
+
+create index if not exists monitor_workers_heartbeat_idx
+    on monitor_workers (heartbeat_at);
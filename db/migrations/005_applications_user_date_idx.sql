@@ -0,0 +1,8 @@
+-- GET /applications/user/{email} filters on email and pages newest first on
+-- (app_date, app_id). This index matches that order and carries the
+-- default response columns, so a page is an index-only range scan instead
+-- of a sort over every row the user has.
+
+create index if not exists applications_email_app_date_idx
+    on applications (email, app_date desc, app_id desc)
+    include (company_name, job_title, status);
@@ -0,0 +1,52 @@
+-- The classifier spells the same company or job title slightly differently
+-- from one email to the next ("Acme  Inc" vs "acme inc"). company_key and
+-- job_key hold the trimmed, whitespace collapsed, lower cased names, and an
+-- application is identified by (email, company_key, job_key): inserts in
+-- db/dbAPI.py upsert on it, and status updates and lookups match on it.
+--
+-- application_key in db/dbAPI.py computes the same key on the API side.
+-- Only ASCII whitespace and ASCII letters are folded, here with an explicit
+-- character class and translate() rather than \s and lower(), so both give
+-- the same key for any input whatever the database locale or Unicode version.
+
+create or replace function application_key(value text)
+returns text
+language sql
+immutable
+parallel safe
+as $$
+    select translate(
+        btrim(regexp_replace(value, '[ \t\n\r\f\v]+', ' ', 'g'), ' '),
+        'ABCDEFGHIJKLMNOPQRSTUVWXYZ',
+        'abcdefghijklmnopqrstuvwxyz'
+    );
+$$;
+
+alter table applications
+    add column if not exists company_key text
+        generated always as (application_key(company_name)) stored,
+    add column if not exists job_key text
+        generated always as (application_key(job_title)) stored;
+
+-- Recompute keys stored by an earlier definition of application_key
+update applications
+set company_name = company_name
+where company_key is distinct from application_key(company_name)
+   or job_key is distinct from application_key(job_title);
+
+-- Keep the newest row of applications that only differ in spelling
+delete from applications a
+using applications b
+where a.email = b.email
+  and a.company_key = b.company_key
+  and a.job_key = b.job_key
+  and a.app_id < b.app_id;
+
+drop index if exists applications_normalized_key_idx;
+create unique index if not exists applications_application_key_idx
+    on applications (email, company_key, job_key)
+    include (app_id, app_date);
+
+-- Superseded: the normalized key is unique whenever the exact one is
+-- (002_applications_natural_key.sql)
+drop index if exists applications_natural_key_idx;
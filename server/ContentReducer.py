@@ -0,0 +1,152 @@
+import os
+import re
+import logging
+import threading
+from html.parser import HTMLParser
+
+# Get environment variables
+CONTENT_TOKEN_BUDGET = int(os.getenv('CONTENT_TOKEN_BUDGET', '1500'))
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4  # rough average for English text with OpenAI tokenizers
+
+_SKIP_TAGS = {"script", "style", "head", "title", "noscript", "template", "svg"}
+_BLOCK_TAGS = {
+    "p", "div", "br", "tr", "li", "ul", "ol", "table", "section", "article",
+    "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "hr", "header", "footer",
+}
+_QUOTE_HEADERS = [
+    re.compile(r'^\s*On .{0,200}wrote:\s*$', re.IGNORECASE),
+    re.compile(r'^\s*-{2,}\s*Original Message\s*-{2,}', re.IGNORECASE),
+    re.compile(r'^\s*-{2,}\s*Forwarded message\s*-{2,}', re.IGNORECASE),
+]
+# Outlook style replies quote a header block instead: From: followed by Sent:/To:/Subject:
+_QUOTED_FROM = re.compile(r'^\s*\*?From:\*?\s.+$', re.IGNORECASE)
+_QUOTED_FIELD = re.compile(r'^\s*\*?(Sent|Date|To|Cc|Subject):\*?\s', re.IGNORECASE)
+_SIGNATURES = [
+    re.compile(r'^--\s*$'),
+    re.compile(r'^\s*Sent from my (iPhone|iPad|Android|mobile)', re.IGNORECASE),
+    re.compile(r'^\s*Get Outlook for ', re.IGNORECASE),
+]
+_BLANK_LINES = re.compile(r'\n\s*\n+')
+_SPACES = re.compile(r'[ \t\r\f\v\u00a0]+')
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.chunks = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self.skipping += 1
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self.skipping = max(0, self.skipping - 1)
+        elif tag in _BLOCK_TAGS:
+            self.chunks.append("\n")
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.chunks.append(data)
+
+def html_to_text(html):
+    """Strip tags, scripts and styles and keep the readable text"""
+    parser = _TextExtractor()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logger.error(f"Error converting HTML to text: {str(e)}")
+    return "".join(parser.chunks)
+
+def _is_quoted_header_block(lines, i):
+    """A From: line only starts quoted history when more header fields follow it"""
+    if not _QUOTED_FROM.match(lines[i]):
+        return False
+    following = [line for line in lines[i + 1:i + 5] if line.strip()][:2]
+    return bool(following) and all(_QUOTED_FIELD.match(line) for line in following)
+
+def strip_quoted(text):
+    """Drop quoted reply history and everything after a reply header"""
+    kept = []
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if kept and (any(pattern.match(line) for pattern in _QUOTE_HEADERS)
+                     or _is_quoted_header_block(lines, i)):
+            break
+        if line.lstrip().startswith(">"):
+            continue
+        kept.append(line)
+    return "\n".join(kept)
+
+def strip_signature(text):
+    """Cut the text at the first signature delimiter"""
+    lines = text.split("\n")
+    for i, line in enumerate(lines):
+        if i and any(pattern.match(line) for pattern in _SIGNATURES):
+            return "\n".join(lines[:i])
+    return text
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def truncate_to_budget(text, token_budget):
+    """Trim text to about token_budget tokens, on a word boundary if possible"""
+    limit = token_budget * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit]
+
+class ReductionStats:
+    """Running totals of estimated tokens before and after reduction"""
+
+    def __init__(self):
+        self.emails = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self._lock = threading.Lock()
+
+    def record(self, before, after):
+        with self._lock:
+            self.emails += 1
+            self.tokens_before += before
+            self.tokens_after += after
+
+    def __str__(self):
+        saved = self.tokens_before - self.tokens_after
+        return f"{saved} of {self.tokens_before} estimated tokens saved over {self.emails} emails"
+
+stats = ReductionStats()
+
+def reduce_content(plain_parts, html_parts, token_budget=None):
+    """
+    Turn the text parts of an email into a compact body for the classifier:
+    plain text wins over HTML, HTML is converted to text only when there is
+    no plain part, quoted history and signatures are dropped and the result
+    is cut to token_budget. Returns the reduced text.
+    """
+    token_budget = token_budget or CONTENT_TOKEN_BUDGET
+    before = estimate_tokens("".join(plain_parts) + "".join(html_parts))
+
+    if any(part.strip() for part in plain_parts):
+        text = "\n".join(plain_parts)
+    else:
+        text = "\n".join(html_to_text(part) for part in html_parts)
+
+    text = strip_signature(strip_quoted(text.replace("\r\n", "\n")))
+    text = _SPACES.sub(" ", text)
+    text = _BLANK_LINES.sub("\n\n", text).strip()
+    text = truncate_to_budget(text, token_budget)
+
+    after = estimate_tokens(text)
+    stats.record(before, after)
+    logger.info(f"Reduced email content from ~{before} to ~{after} tokens ({before - after} saved)")
+    return text
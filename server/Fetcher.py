@@ -0,0 +1,261 @@
+import os
+import re
+import logging
+from email.message import Message
+from email.parser import BytesHeaderParser
+from Metrics import IMAP_SECONDS
+from MimeParser import MIME_MAX_PART_BYTES
+
+# Get environment variables
+FETCH_CHUNK_SIZE = int(os.getenv('FETCH_CHUNK_SIZE', '50'))
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUBTYPES = ("plain", "html")
+_LITERAL = re.compile(rb'\{(\d+)\}$')
+_PARTIAL = re.compile(r'<\d+>$')
+# Encoded bytes that can hold MIME_MAX_PART_BYTES decoded ones, quoted-printable being the worst
+MAX_SECTION_OCTETS = MIME_MAX_PART_BYTES * 3
+
+def message_set(nums):
+    """Turn a list of message numbers into a compact IMAP set, e.g. 1:3,7"""
+    nums = sorted({int(n) for n in nums})
+    ranges = []
+    for n in nums:
+        if ranges and n == ranges[-1][1] + 1:
+            ranges[-1][1] = n
+        else:
+            ranges.append([n, n])
+    return ",".join(str(a) if a == b else f"{a}:{b}" for a, b in ranges)
+
+def chunks(nums, size):
+    """Split message numbers into lists of at most size items"""
+    for i in range(0, len(nums), size):
+        yield nums[i:i + size]
+
+def _tokenize(data):
+    """
+    Flatten an imaplib FETCH response into tokens.
+    Literals are returned as bytes, everything else as str or '(' / ')'.
+    """
+    tokens = []
+    for item in data:
+        if item is None:
+            continue
+        literal = None
+        if isinstance(item, tuple):
+            item, literal = item
+        text = item.decode('utf-8', 'replace') if isinstance(item, bytes) else item
+        if literal is not None:
+            text = _LITERAL.sub(b'', item).decode('utf-8', 'replace')
+        i = 0
+        while i < len(text):
+            c = text[i]
+            if c in " \r\n":
+                i += 1
+            elif c in "()":
+                tokens.append(c)
+                i += 1
+            elif c == '"':
+                j = i + 1
+                value = []
+                while j < len(text) and text[j] != '"':
+                    if text[j] == '\\' and j + 1 < len(text):
+                        j += 1
+                    value.append(text[j])
+                    j += 1
+                tokens.append(("str", "".join(value)))
+                i = j + 1
+            else:
+                j = i
+                depth = 0
+                # BODY[1.MIME] style atoms may contain spaces inside brackets
+                while j < len(text) and (depth or text[j] not in ' ()"'):
+                    if text[j] == '[':
+                        depth += 1
+                    elif text[j] == ']':
+                        depth -= 1
+                    j += 1
+                tokens.append(text[i:j])
+                i = j
+        if literal is not None:
+            tokens.append(literal)
+        tokens.append(" ")
+    return [t for t in tokens if t != " "]
+
+def _parse(tokens):
+    """Build nested lists out of tokens, NIL becomes None"""
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        elif isinstance(token, tuple):
+            stack[-1].append(token[1])
+        elif isinstance(token, str) and token.upper() == "NIL":
+            stack[-1].append(None)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+def parse_fetch_response(data, by_uid=False):
+    """
+    Return {message number: {ITEM NAME: value}} for a FETCH response,
+    keyed by the UID item instead when by_uid is set.
+    """
+    parsed = _parse(_tokenize(data))
+    result = {}
+    i = 0
+    while i < len(parsed) - 1:
+        num, items = parsed[i], parsed[i + 1]
+        if isinstance(num, str) and num.isdigit() and isinstance(items, list):
+            fields = {}
+            for j in range(0, len(items) - 1, 2):
+                # Partial fetches answer as BODY[1]<0>, key them like full ones
+                key = _PARTIAL.sub("", items[j].upper().replace("BODY.PEEK[", "BODY["))
+                fields[key] = items[j + 1]
+            if by_uid:
+                num = fields.get("UID")
+            if num is not None:
+                result.setdefault(str(num), {}).update(fields)
+            i += 2
+        else:
+            i += 1
+    return result
+
+def _params(value):
+    """Turn a (key value key value) parameter list into a dict"""
+    if not isinstance(value, list):
+        return {}
+    return {str(value[i]).lower(): value[i + 1] for i in range(0, len(value) - 1, 2)}
+
+def _is_attachment(body):
+    """Check the disposition and name params of a single part"""
+    if _params(body[2]).get("name"):
+        return True
+    # Extension data sits after the lines field on text parts
+    for extra in body[7:]:
+        if isinstance(extra, list) and extra and isinstance(extra[0], str):
+            if extra[0].lower() == "attachment":
+                return True
+            if _params(extra[1] if len(extra) > 1 else None).get("filename"):
+                return True
+    return False
+
+def text_parts(structure, section=""):
+    """
+    Walk a parsed BODYSTRUCTURE and return the inline text parts as
+    (section, subtype, charset, encoding) without touching attachments.
+    """
+    parts = []
+    if not isinstance(structure, list) or not structure:
+        return parts
+
+    if isinstance(structure[0], list):
+        # Multipart: child bodies first, then the subtype
+        child = 0
+        for item in structure:
+            if not isinstance(item, list):
+                break
+            child += 1
+            prefix = f"{section}.{child}" if section else str(child)
+            parts.extend(text_parts(item, prefix))
+        return parts
+
+    if len(structure) < 7 or not isinstance(structure[0], str):
+        return parts
+    main_type = structure[0].lower()
+    subtype = str(structure[1]).lower()
+    if main_type != "text" or subtype not in TEXT_SUBTYPES or _is_attachment(structure):
+        return parts
+
+    charset = _params(structure[2]).get("charset") or "utf-8"
+    encoding = (structure[5] or "7bit").lower()
+    parts.append((section or "1", subtype, charset, encoding))
+    return parts
+
+def build_message(header, parts):
+    """
+    Rebuild a trimmed email.message.Message from the raw header and the
+    fetched text parts so get_email_content can walk it as usual.
+    """
+    msg = BytesHeaderParser().parsebytes(header or b"")
+    for name in ("Content-Type", "Content-Transfer-Encoding"):
+        del msg[name]
+    msg["Content-Type"] = "multipart/mixed"
+    children = []
+    for subtype, charset, encoding, body in parts:
+        part = Message()
+        part["Content-Type"] = f'text/{subtype}; charset="{charset}"'
+        part["Content-Transfer-Encoding"] = encoding
+        part.set_payload(body.decode('ascii', 'surrogateescape'))
+        children.append(part)
+    msg.set_payload(children)
+    return msg
+
+def _fetch(imap, uids, items):
+    """Run one UID FETCH and parse its response"""
+    with IMAP_SECONDS.labels("fetch").time():
+        status, data = imap.uid("FETCH", uids, items)
+    if status != "OK":
+        raise RuntimeError(f"FETCH {uids} failed: {data}")
+    return parse_fetch_response(data, by_uid=True)
+
+def fetch_messages(imap, uids, chunk_size=None):
+    """
+    Fetch messages in batches of chunk_size with two round trips per batch:
+    one for headers and BODYSTRUCTURE, one per distinct set of text sections.
+    Attachments are never downloaded and text parts are capped at
+    MAX_SECTION_OCTETS. Yields (uid, Message) and leaves the messages unread.
+    A failed FETCH raises after the messages of the earlier batches were
+    yielded, so callers never move their sync state past unfetched mail.
+    """
+    nums = [n.decode() if isinstance(n, bytes) else str(n) for n in uids]
+    chunk_size = chunk_size or FETCH_CHUNK_SIZE
+
+    for chunk in chunks(nums, chunk_size):
+        try:
+            heads = _fetch(imap, message_set(chunk), "(BODY.PEEK[HEADER] BODYSTRUCTURE)")
+        except Exception as e:
+            logger.error(f"Error fetching headers for {message_set(chunk)}: {str(e)}")
+            raise
+
+        # Messages sharing the same text sections are fetched together
+        wanted = {}
+        groups = {}
+        for num in chunk:
+            fields = heads.get(num)
+            if not fields:
+                continue
+            wanted[num] = text_parts(fields.get("BODYSTRUCTURE"))
+            sections = tuple(section for section, *_ in wanted[num])
+            if sections:
+                groups.setdefault(sections, []).append(num)
+
+        bodies = {}
+        for sections, group in groups.items():
+            # Text parts are cut server side, MimeParser never decodes more than the cap anyway
+            items = "(" + " ".join(f"BODY.PEEK[{s}]<0.{MAX_SECTION_OCTETS}>" for s in sections) + ")"
+            try:
+                bodies.update(_fetch(imap, message_set(group), items))
+            except Exception as e:
+                logger.error(f"Error fetching bodies for {message_set(group)}: {str(e)}")
+                raise
+
+        for num in chunk:
+            if num not in wanted:
+                continue
+            parts = []
+            for section, subtype, charset, encoding in wanted[num]:
+                body = bodies.get(num, {}).get(f"BODY[{section}]")
+                if isinstance(body, str):
+                    body = body.encode('utf-8')
+                if body:
+                    parts.append((subtype, charset, encoding, body))
+            header = heads[num].get("BODY[HEADER]")
+            if isinstance(header, str):
+                header = header.encode('utf-8')
+            yield num, build_message(header, parts)
@@ -0,0 +1,163 @@
+import os
+import time
+import random
+import logging
+import requests
+import threading
+from urllib.parse import quote
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from Metrics import DB_API_SECONDS, TRACE_HEADER, current_trace, new_trace_id
+
+load_dotenv()
+# Get environment variables
+DB_API_ADDY = os.getenv('DB_API_ADDY')
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '32'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.5'))
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUSES = {429, 502, 503, 504}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf"))
+
+class LatencyHistogram:
+    """Fixed bucket latency histogram, safe to update from many threads"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    self.counts[i] += 1
+                    break
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile"""
+        with self._lock:
+            target = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if count and seen >= target:
+                    return bound
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+        }
+
+class _Endpoints:
+    """One histogram per 'METHOD /route/{template}'"""
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, seconds):
+        with self._lock:
+            histogram = self.histograms.setdefault(endpoint, LatencyHistogram())
+        histogram.observe(seconds)
+        DB_API_SECONDS.labels(endpoint).observe(seconds)
+
+    def summary(self):
+        with self._lock:
+            histograms = dict(self.histograms)
+        return {endpoint: h.summary() for endpoint, h in histograms.items()}
+
+def _build_url(base_url, route, path_params):
+    path = route.format(**{k: quote(str(v), safe="") for k, v in path_params.items()})
+    return f"{base_url}{path}"
+
+def _backoff(attempt):
+    # Full jitter exponential backoff
+    return random.uniform(0, HTTP_BACKOFF * (2 ** attempt))
+
+def _should_retry(method, idempotent):
+    return idempotent if idempotent is not None else method in IDEMPOTENT_METHODS
+
+def _trace_headers(kwargs):
+    # The DB API logs and echoes the id, retries of one call share it
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.setdefault(TRACE_HEADER, current_trace.get() or new_trace_id())
+    return headers
+
+class DBClient:
+    """
+    Pooled keep-alive client for the DB API. Routes are templates such as
+    '/users/{email}/sync-state', path params are URL quoted, every call has
+    a timeout and idempotent calls are retried with jittered backoff.
+    """
+
+    def __init__(self, base_url=None, pool_size=None, retries=None):
+        self.base_url = (base_url or DB_API_ADDY or "").rstrip("/")
+        self.retries = HTTP_RETRIES if retries is None else retries
+        self.timeout = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+        self.latency = _Endpoints()
+        pool_size = pool_size or HTTP_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, route, idempotent=None, **kwargs):
+        """Send a request and return the requests.Response of the last attempt"""
+        method = method.upper()
+        path_params = kwargs.pop("path_params", {})
+        url = _build_url(self.base_url, route, path_params)
+        kwargs.setdefault("timeout", self.timeout)
+        retries = self.retries if _should_retry(method, idempotent) else 0
+        endpoint = f"{method} {route}"
+        kwargs["headers"] = _trace_headers(kwargs)
+
+        for attempt in range(retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.latency.observe(endpoint, time.perf_counter() - start)
+                if attempt == retries:
+                    raise
+                logger.warning(f"{endpoint} failed ({str(e)}), retrying")
+                time.sleep(_backoff(attempt))
+                continue
+
+            self.latency.observe(endpoint, time.perf_counter() - start)
+            if response.status_code in RETRY_STATUSES and attempt < retries:
+                logger.warning(f"{endpoint} returned {response.status_code}, retrying")
+                time.sleep(_backoff(attempt))
+                continue
+            return response
+
+    def get(self, route, **kwargs):
+        return self.request("GET", route, **kwargs)
+
+    def post(self, route, **kwargs):
+        return self.request("POST", route, **kwargs)
+
+    def put(self, route, **kwargs):
+        return self.request("PUT", route, **kwargs)
+
+    def delete(self, route, **kwargs):
+        return self.request("DELETE", route, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+# Shared by every module that talks to the DB API
+client = DBClient()
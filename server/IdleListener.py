@@ -0,0 +1,208 @@
+import os
+import time
+import socket
+import random
+import logging
+import threading
+
+# Get environment variables
+IDLE_TIMEOUT = int(os.getenv('IDLE_TIMEOUT', str(25 * 60)))
+IDLE_MIN_BACKOFF = int(os.getenv('IDLE_MIN_BACKOFF', '5'))
+IDLE_MAX_BACKOFF = int(os.getenv('IDLE_MAX_BACKOFF', '300'))
+IDLE_FALLBACK_INTERVAL = int(os.getenv('IDLE_FALLBACK_INTERVAL', '60'))
+
+logger = logging.getLogger(__name__)
+
+IDLE_TAG = b"JTIDLE"
+POLL_SLICE = 1.0  # seconds between checks of the stop flag while idling
+STOP_TIMEOUT = 5  # seconds to wait for a stopped worker to exit
+
+class IdleSession:
+    """
+    Runs IMAP IDLE on an authenticated, selected imaplib connection.
+    Reads go straight to the socket so a timeout never poisons imaplib's
+    buffered file, which stays usable for normal commands between idles.
+    """
+
+    def __init__(self, imap, stop_event):
+        self.imap = imap
+        self.sock = imap.sock
+        self.stop_event = stop_event
+        self._buffer = b""
+
+    def _readline(self, deadline, stoppable=True):
+        """Return the next line, or None once deadline passes or stop is set"""
+        while b"\r\n" not in self._buffer:
+            if (stoppable and self.stop_event.is_set()) or time.monotonic() >= deadline:
+                return None
+            self.sock.settimeout(min(POLL_SLICE, max(0.01, deadline - time.monotonic())))
+            try:
+                data = self.sock.recv(4096)
+            except (socket.timeout, TimeoutError):
+                continue
+            if not data:
+                raise ConnectionError("IMAP server closed the connection")
+            self._buffer += data
+        line, self._buffer = self._buffer.split(b"\r\n", 1)
+        return line
+
+    def _finish(self):
+        """Leave IDLE and wait for the tagged completion"""
+        self.imap.send(b"DONE\r\n")
+        deadline = time.monotonic() + 30
+        while True:
+            line = self._readline(deadline, stoppable=False)
+            if line is None:
+                raise TimeoutError("IMAP server did not end IDLE")
+            if line.startswith(IDLE_TAG + b" "):
+                if b" OK" not in line.upper():
+                    raise ConnectionError(f"IDLE failed: {line!r}")
+                return
+
+    def wait(self, timeout):
+        """
+        Idle until the server pushes EXISTS (returns True), the timeout
+        runs out (returns False) or the stop flag is set (returns False).
+        """
+        try:
+            self.imap.send(IDLE_TAG + b" IDLE\r\n")
+            deadline = time.monotonic() + 30
+            while True:
+                line = self._readline(deadline)
+                if line is None:
+                    raise TimeoutError("IMAP server did not accept IDLE")
+                if line.startswith(b"+"):
+                    break
+                if line.startswith(IDLE_TAG + b" "):
+                    raise ConnectionError(f"IDLE rejected: {line!r}")
+
+            deadline = time.monotonic() + timeout
+            got_mail = False
+            while not got_mail:
+                line = self._readline(deadline)
+                if line is None:
+                    break
+                upper = line.upper()
+                if upper.startswith(b"* BYE"):
+                    raise ConnectionError(f"IMAP server said goodbye: {line!r}")
+                if upper.startswith(b"*") and upper.endswith(b"EXISTS"):
+                    got_mail = True
+
+            self._finish()
+            return got_mail
+        finally:
+            self.sock.settimeout(None)
+
+class IdleWorker(threading.Thread):
+    """Keeps one IDLE connection open for a user and reconnects with backoff"""
+
+    def __init__(self, email_address, password, connect, on_new_mail):
+        super().__init__(name=f"idle-{email_address}", daemon=True)
+        self.email_address = email_address
+        self.password = password
+        self.connect = connect
+        self.on_new_mail = on_new_mail
+        self.stop_event = threading.Event()
+        self.backoff = IDLE_MIN_BACKOFF
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _sleep_backoff(self):
+        # Full jitter so a host outage doesn't reconnect everyone at once
+        delay = random.uniform(0, self.backoff)
+        logger.info(f"Reconnecting {self.email_address} in {delay:.0f}s")
+        self.stop_event.wait(delay)
+        self.backoff = min(self.backoff * 2, IDLE_MAX_BACKOFF)
+
+    def _sync(self, imap):
+        # Any EXISTS imaplib holds so far is covered by this sync
+        imap.untagged_responses.pop('EXISTS', None)
+        self.on_new_mail(imap, self.email_address)
+
+    def _serve(self, imap):
+        """Catch up once, then sync every time the server reports new mail"""
+        imap.select("INBOX")
+        self._sync(imap)
+        self.backoff = IDLE_MIN_BACKOFF
+
+        if "IDLE" not in imap.capabilities:
+            logger.warning(f"{self.email_address}'s server has no IDLE, polling instead")
+            while not self.stop_event.wait(IDLE_FALLBACK_INTERVAL):
+                self._sync(imap)
+            return
+
+        session = IdleSession(imap, self.stop_event)
+        while not self.stop_event.is_set():
+            if imap.untagged_responses.get('EXISTS'):
+                # Reported during the last sync or NOOP, IDLE won't announce it again
+                logger.info(f"New mail for {self.email_address} arrived while syncing")
+                self._sync(imap)
+            elif session.wait(IDLE_TIMEOUT):
+                logger.info(f"New mail for {self.email_address}")
+                self._sync(imap)
+            elif not self.stop_event.is_set():
+                # Re-IDLE before the server drops us, and keep the connection alive
+                imap.noop()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            imap = None
+            try:
+                imap = self.connect(self.email_address, self.password)
+                logger.info(f"Listening to {self.email_address}'s inbox")
+                self._serve(imap)
+            except Exception as e:
+                logger.error(f"IDLE connection for {self.email_address} failed: {str(e)}")
+                self._sleep_backoff()
+            finally:
+                if imap:
+                    try:
+                        imap.logout()
+                    except Exception:
+                        pass
+
+class IdleListener:
+    """Owns one IdleWorker per listening user"""
+
+    def __init__(self, connect, on_new_mail):
+        self.connect = connect
+        self.on_new_mail = on_new_mail
+        self.workers = {}
+        self.stopping = {}
+
+    def sync_users(self, users):
+        """Start workers for new listening users and stop the rest"""
+        wanted = {
+            user['email']: user['email_app_password']
+            for user in users if user['listening']
+        }
+
+        for email_address, worker in list(self.workers.items()):
+            if wanted.get(email_address) != worker.password or not worker.is_alive():
+                worker.stop()
+                self.stopping[email_address] = worker
+                del self.workers[email_address]
+
+        # An old and a new worker must never sync the same inbox at once
+        for email_address, worker in list(self.stopping.items()):
+            worker.join(timeout=STOP_TIMEOUT)
+            if worker.is_alive():
+                logger.warning(f"IDLE worker for {email_address} is still stopping")
+            else:
+                del self.stopping[email_address]
+
+        for email_address, password in wanted.items():
+            if email_address not in self.workers and email_address not in self.stopping:
+                worker = IdleWorker(email_address, password, self.connect, self.on_new_mail)
+                self.workers[email_address] = worker
+                worker.start()
+
+    def stop(self):
+        workers = list(self.workers.values()) + list(self.stopping.values())
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join(timeout=STOP_TIMEOUT)
+        self.workers = {}
+        self.stopping = {}
@@ -0,0 +1,103 @@
+import os
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+# Get environment variables
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0 leaves /metrics off
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(trace_id)s - %(message)s'
+
+# Trace id of the email (or DB API request) the current thread is working on
+current_trace = contextvars.ContextVar("trace_id", default=None)
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def tracing(trace_id=None):
+    """Run a block under trace_id (a fresh one by default), yields the id"""
+    token = current_trace.set(trace_id or new_trace_id())
+    try:
+        yield current_trace.get()
+    finally:
+        current_trace.reset(token)
+
+def _install_trace_logging():
+    # Every log record gets a trace_id attribute so LOG_FORMAT can print it
+    factory = logging.getLogRecordFactory()
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.trace_id = current_trace.get() or "-"
+        return record
+
+    logging.setLogRecordFactory(record_factory)
+
+_install_trace_logging()
+
+SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+SWEEP_SECONDS = Histogram(
+    'monitor_sweep_seconds', 'Time to check one inbox for new mail, through its last write',
+    buckets=SECONDS_BUCKETS
+)
+IMAP_SECONDS = Histogram(
+    'monitor_imap_seconds', 'IMAP latency by operation (connect, search, fetch)', ['op'],
+    buckets=SECONDS_BUCKETS
+)
+LLM_SECONDS = Histogram(
+    'monitor_llm_seconds', 'Classifier request latency, single email or batch', ['mode'],
+    buckets=SECONDS_BUCKETS
+)
+LLM_REQUESTS = Counter('monitor_llm_requests_total', 'Classifier requests by outcome', ['outcome'])
+LLM_TOKENS = Counter('monitor_llm_tokens_total', 'Tokens used by classifier requests', ['kind'])
+CLASSIFICATIONS = Counter(
+    'monitor_classifications_total', 'Classified emails by type and status', ['type', 'status']
+)
+CLASSIFICATION_CACHE = Counter(
+    'monitor_classification_cache_total', 'Classification cache lookups', ['result']
+)
+DB_API_SECONDS = Histogram(
+    'monitor_db_api_seconds', 'DB API request latency per attempt', ['endpoint'],
+    buckets=SECONDS_BUCKETS
+)
+STAGE_ITEMS = Counter('monitor_pipeline_items_total', 'Items handled per pipeline stage', ['stage'])
+STAGE_BUSY_SECONDS = Counter(
+    'monitor_pipeline_busy_seconds_total', 'Time pipeline stage workers spent handling items', ['stage']
+)
+STAGE_QUEUE_DEPTH = Gauge('monitor_pipeline_queue_depth', 'Items waiting in front of a pipeline stage', ['stage'])
+
+# Label values the classifier can produce, anything else is counted as "other"
+CLASSIFICATION_TYPES = {0, 1, 2}
+CLASSIFICATION_STATUSES = {"-", "Pending Response", "Rejected", "Interview Scheduled", "Talk Scheduled", "Offer Received"}
+
+def record_classification(answer):
+    """Count one classifier answer, keeping label values bounded"""
+    type_ = str(answer.type) if answer.type in CLASSIFICATION_TYPES else "other"
+    status = answer.status if answer.status in CLASSIFICATION_STATUSES else "other"
+    CLASSIFICATIONS.labels(type_, status).inc()
+
+def record_llm_usage(completion):
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+    LLM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+_server_started = False
+
+def start_metrics_server(port=None):
+    """Serve /metrics on METRICS_PORT (once per process), no-op when it is unset"""
+    global _server_started
+    port = METRICS_PORT if port is None else port
+    if not port or _server_started:
+        return
+    start_http_server(port)
+    _server_started = True
+    logger.info(f"Serving metrics on :{port}/metrics")
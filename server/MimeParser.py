@@ -0,0 +1,122 @@
+import os
+import codecs
+import quopri
+import base64
+import binascii
+
+# Get environment variables
+MIME_MAX_PART_BYTES = int(os.getenv('MIME_MAX_PART_BYTES', str(100 * 1024)))
+
+# Charsets mail clients declare that Python knows under another name
+CHARSET_ALIASES = {
+    "unknown-8bit": "latin-1",
+    "x-unknown": "latin-1",
+    "us-ascii": "ascii",
+    "ks_c_5601-1987": "cp949",
+    "x-mac-roman": "mac_roman",
+    "gb2312": "gb18030",  # superset, senders often mislabel GBK mail as gb2312
+}
+
+def is_attachment(part):
+    """True for parts with an attachment disposition or a file name"""
+    disposition = str(part.get("Content-Disposition", "")).split(";", 1)[0].strip().lower()
+    return disposition == "attachment" or bool(part.get_param("filename", header="Content-Disposition")) \
+        or bool(part.get_param("name"))
+
+def _lookup_charset(charset):
+    charset = CHARSET_ALIASES.get(charset, charset)
+    try:
+        return codecs.lookup(charset).name
+    except LookupError:
+        return None
+
+def decode_payload(part, max_bytes=None):
+    """
+    Transfer-decode at most max_bytes of a leaf part. Only the slice of the
+    encoded payload needed for max_bytes is decoded, so a huge part costs
+    no more than a small one. Returns bytes.
+    """
+    max_bytes = max_bytes or MIME_MAX_PART_BYTES
+    encoding = str(part.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+    if encoding not in ("base64", "quoted-printable"):
+        # 7bit/8bit bodies come back byte for byte, without the lossy
+        # charset round trip get_payload() does on 8bit text
+        return (part.get_payload(decode=True) or b"")[:max_bytes]
+
+    payload = part.get_payload()
+    if not isinstance(payload, str):
+        return b""
+    if encoding == "base64":
+        # 4 characters per 3 bytes, plus room for the line breaks every 76
+        encoded = "".join(payload[:max_bytes * 4 // 3 + max_bytes // 38 + 8].split())
+        encoded = encoded[:len(encoded) - len(encoded) % 4]
+        try:
+            return base64.b64decode(encoded)[:max_bytes]
+        except (binascii.Error, ValueError):
+            return binascii.a2b_base64(encoded.encode("ascii", "ignore") + b"==")[:max_bytes]
+    raw = payload[:max_bytes * 3].encode("ascii", "surrogateescape")
+    # Don't leave half an =XX escape at the cut
+    cut = raw.rfind(b"=", max(0, len(raw) - 2))
+    if cut != -1 and len(raw) >= max_bytes * 3:
+        raw = raw[:cut]
+    return quopri.decodestring(raw)[:max_bytes]
+
+def _decode(data, charset):
+    # Not final, so a multi-byte character split by the byte cap is dropped instead of failing
+    return codecs.getincrementaldecoder(charset)().decode(data, final=False)
+
+def decode_text(part, max_bytes=None):
+    """Decode a text part with its declared charset, never raising on bad bytes"""
+    data = decode_payload(part, max_bytes)
+    charset = _lookup_charset(str(part.get_content_charset() or "utf-8").lower())
+    if charset:
+        try:
+            return _decode(data, charset)
+        except UnicodeDecodeError:
+            pass
+    # Undeclared or wrong charset: UTF-8 if it fits, else Windows-1252, which
+    # is what mislabelled Western mail almost always is
+    try:
+        return _decode(data, "utf-8")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", "replace")
+
+def _text_leaves(msg):
+    """Inline text/plain and text/html parts in document order, attachments skipped"""
+    stack = [msg]
+    while stack:
+        part = stack.pop()
+        if part.is_multipart():
+            payload = part.get_payload()
+            # Attached emails are attachments too
+            if part.get_content_type() != "message/rfc822":
+                stack.extend(reversed(payload))
+            continue
+        if part.get_content_maintype() != "text" or is_attachment(part):
+            continue
+        if part.get_content_subtype() in ("plain", "html"):
+            yield part
+
+def _first_text(leaves, max_bytes):
+    html_candidates = []
+    for part in leaves:
+        if part.get_content_subtype() == "html":
+            html_candidates.append(part)
+            continue
+        text = decode_text(part, max_bytes)
+        if text.strip():
+            return [text], []
+
+    for part in html_candidates:
+        text = decode_text(part, max_bytes)
+        if text.strip():
+            return [], [text]
+    return [], []
+
+def extract_text(msg, max_bytes=None):
+    """
+    Return (plain_parts, html_parts) for reduce_content, holding at most one
+    part: the first non empty text/plain, else the first non empty text/html.
+    HTML parts are only decoded when no plain text turns up.
+    """
+    return _first_text(_text_leaves(msg), max_bytes)
@@ -0,0 +1,361 @@
+import os
+import time
+import queue
+import logging
+import threading
+from Fetcher import fetch_messages
+from PreFilter import is_candidate
+from email.header import decode_header
+from Requests import classify_emails, ApplicationBatch, LLM_BATCH_SIZE, LLM_MAX_IN_FLIGHT
+from SyncState import load_sync_state, save_sync_state, new_message_uids, next_high_water
+from Scanner import HostLimiter, DEFAULT_IMAP_SERVER, MAX_CONCURRENT_USERS, MAX_CONNECTIONS_PER_HOST
+from Metrics import SWEEP_SECONDS, STAGE_ITEMS, STAGE_BUSY_SECONDS, STAGE_QUEUE_DEPTH, new_trace_id, tracing
+
+# Get environment variables
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '200'))
+PIPELINE_PARSE_WORKERS = int(os.getenv('PIPELINE_PARSE_WORKERS', '2'))
+PIPELINE_WRITE_BATCH = int(os.getenv('PIPELINE_WRITE_BATCH', '100'))
+PIPELINE_REPORT_INTERVAL = float(os.getenv('PIPELINE_REPORT_INTERVAL', '10'))
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class UserSweep:
+    """
+    One user's inbox in a sweep. Counts the messages still moving through
+    the pipeline and saves the sync state once the last one is written,
+    never past a message whose classification or write failed.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.email = user['email']
+        self.state = None
+        self.uid_validity = None
+        self.last_uid = 0
+        self.high_water = 0
+        self.pending = 0
+        self.found = 0
+        self.fetched = False
+        self.failed = False
+        self.failed_uids = []
+        self.started = None
+        self._lock = threading.Lock()
+
+    @property
+    def result(self):
+        """Job emails found, or False when the inbox couldn't be read or a write failed"""
+        return False if self.failed or self.failed_uids else self.found
+
+    def add(self):
+        with self._lock:
+            self.pending += 1
+
+    def release(self, found=False, failed_uid=None):
+        with self._lock:
+            self.pending -= 1
+            self.found += 1 if found else 0
+            if failed_uid is not None:
+                self.failed_uids.append(failed_uid)
+            finished = self.fetched and self.pending == 0
+        if finished:
+            self._finish()
+
+    def fetch_done(self, failed=False):
+        with self._lock:
+            self.fetched = True
+            self.failed = failed
+            finished = self.pending == 0
+        if finished:
+            self._finish()
+
+    def _finish(self):
+        if self.started is not None:
+            SWEEP_SECONDS.observe(time.monotonic() - self.started)
+        # Unlike check_for_new_emails, which saves nothing when a FETCH fails,
+        # mail fetched before the failure still moves the mark
+        mark = next_high_water(self.state, self.uid_validity, self.last_uid, self.high_water,
+                               self.failed_uids, complete=not self.failed)
+        if mark is not None:
+            save_sync_state(self.email, self.uid_validity, mark)
+
+class Job:
+    """One message on its way from fetch to write"""
+
+    def __init__(self, sweep, num, message):
+        self.sweep = sweep
+        self.num = num
+        self.message = message
+        # Follows the email through the stages and into the DB API
+        self.trace_id = new_trace_id()
+        self.text = None
+        self.answer = None
+        self.released = False
+
+    def release(self, found=False, failed=False):
+        """Done with this message; failed keeps the user's sync state below it"""
+        if not self.released:
+            self.released = True
+            self.sweep.release(found, int(self.num) if failed else None)
+
+class Stage:
+    """
+    A pool of worker threads taking up to batch_size items at a time from
+    inbox and handing them to handler(items, emit). emit puts onto the next
+    stage's bounded queue, so a slow stage holds back the ones before it.
+    """
+
+    def __init__(self, name, handler, workers, inbox, outbox=None, batch_size=1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.batch_size = max(1, batch_size)
+        self.processed = 0
+        self.emitted = 0
+        self.busy = 0.0
+        self.max_depth = 0
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def emit(self, item):
+        self.outbox.put(item)
+        with self._lock:
+            self.emitted += 1
+
+    def _take(self):
+        """Block for one item, then top the batch up with whatever is already queued"""
+        depth = self.inbox.qsize()
+        self.max_depth = max(self.max_depth, depth)
+        STAGE_QUEUE_DEPTH.labels(self.name).set(depth)
+        item = self.inbox.get()
+        if item is _DONE:
+            return None
+        items = [item]
+        while len(items) < self.batch_size:
+            try:
+                item = self.inbox.get_nowait()
+            except queue.Empty:
+                break
+            if item is _DONE:
+                # Leave the stop marker for this or another worker
+                self.inbox.put(_DONE)
+                break
+            items.append(item)
+        return items
+
+    def _work(self):
+        while True:
+            items = self._take()
+            if items is None:
+                return
+            start = time.perf_counter()
+            try:
+                self.handler(items, self.emit)
+            except Exception as e:
+                logger.error(f"{self.name} stage failed on {len(items)} items: {str(e)}")
+                for item in items:
+                    if isinstance(item, Job):
+                        item.release(failed=True)
+            busy = time.perf_counter() - start
+            with self._lock:
+                self.processed += len(items)
+                self.busy += busy
+            STAGE_ITEMS.labels(self.name).inc(len(items))
+            STAGE_BUSY_SECONDS.labels(self.name).inc(busy)
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def finish(self):
+        """Stop the workers once the queue is drained and wait for them"""
+        for _ in self._threads:
+            self.inbox.put(_DONE)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self, elapsed):
+        return {
+            "workers": self.workers,
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "per_second": self.processed / elapsed if elapsed else 0.0,
+            "utilization": self.busy / (elapsed * self.workers) if elapsed else 0.0,
+            "queue_depth": self.inbox.qsize(),
+            "max_queue_depth": self.max_depth,
+        }
+
+class Pipeline:
+    """
+    Sweep of many inboxes as four overlapping stages:
+    fetch (IMAP) -> parse (MIME + pre-filter) -> classify (LLM) -> write (DB API).
+    Each stage has its own workers and a bounded queue in front of it, so
+    IMAP, the classifier and the DB API are all busy at the same time.
+    """
+
+    def __init__(self, connect, get_content, fetch_workers=None, parse_workers=None,
+                 classify_workers=None, queue_size=None, write_batch=None, per_host_limit=None):
+        self.connect = connect
+        self.get_content = get_content
+        self.limiter = HostLimiter(per_host_limit or MAX_CONNECTIONS_PER_HOST)
+        self.batch = ApplicationBatch()
+        queue_size = queue_size or PIPELINE_QUEUE_SIZE
+
+        users, messages, texts, answers = (queue.Queue(maxsize=queue_size) for _ in range(4))
+        self.fetch = Stage("fetch", self._fetch, fetch_workers or MAX_CONCURRENT_USERS, users, messages)
+        self.parse = Stage("parse", self._parse, parse_workers or PIPELINE_PARSE_WORKERS, messages, texts)
+        self.classify = Stage("classify", self._classify, classify_workers or LLM_MAX_IN_FLIGHT,
+                              texts, answers, batch_size=LLM_BATCH_SIZE)
+        # One writer so bulk requests don't race, batches grow while the DB API is busy
+        self.write = Stage("write", self._write, 1, answers, batch_size=write_batch or PIPELINE_WRITE_BATCH)
+        self.stages = [self.fetch, self.parse, self.classify, self.write]
+
+    def _fetch(self, sweeps, emit):
+        for sweep in sweeps:
+            host = sweep.user.get('imap_server') or DEFAULT_IMAP_SERVER
+            with self.limiter.get(host):
+                self._fetch_inbox(sweep, emit)
+
+    def _fetch_inbox(self, sweep, emit):
+        imap = None
+        failed = False
+        sweep.started = time.monotonic()
+        try:
+            imap = self.connect(sweep.email, sweep.user['email_app_password'])
+            imap.select("INBOX")
+            sweep.state = load_sync_state(sweep.email)
+            sweep.uid_validity, sweep.last_uid, uids = new_message_uids(imap, sweep.state)
+            sweep.high_water = sweep.last_uid
+            for num, message in fetch_messages(imap, uids):
+                sweep.high_water = max(sweep.high_water, int(num))
+                sweep.add()
+                emit(Job(sweep, num, message))
+        except Exception as e:
+            logger.error(f"Error checking inbox for {sweep.email}: {str(e)}")
+            failed = True
+        finally:
+            if imap:
+                try:
+                    imap.logout()
+                except Exception as e:
+                    logger.error(f"Error logging out: {str(e)}")
+            sweep.fetch_done(failed)
+
+    def _parse(self, jobs, emit):
+        for job in jobs:
+            with tracing(job.trace_id):
+                self._parse_one(job, emit)
+
+    def _parse_one(self, job, emit):
+        try:
+            message = job.message
+            subject = decode_header(message["Subject"])[0][0]
+            if isinstance(subject, bytes):
+                subject = subject.decode()
+            from_ = decode_header(message["From"])[0][0]
+            if isinstance(from_, bytes):
+                from_ = from_.decode()
+            content = self.get_content(message)
+        except Exception as e:
+            logger.error(f"Error processing email {job.num}: {str(e)}")
+            job.release()
+            return
+
+        # Obvious non job mail never reaches the LLM
+        if not is_candidate(message["From"], subject, content):
+            job.release()
+            return
+        job.message = None  # the text is all later stages need
+        job.text = f"\nFrom: {from_}\nSubject: {subject}\nContent: {content}"
+        emit(job)
+
+    def _classify(self, jobs, emit):
+        # Concurrency comes from the stage's workers, one request each
+        answers = classify_emails([job.text for job in jobs], max_in_flight=1)
+        for job, answer in zip(jobs, answers):
+            if answer is None:
+                # The classifier request failed, the next sweep tries again
+                job.release(failed=True)
+                continue
+            job.answer = answer
+            emit(job)
+
+    def _write(self, jobs, emit):
+        queued = []
+        for job in jobs:
+            if self.batch.add(job.answer, job.sweep.email, job.trace_id):
+                queued.append(job)
+            else:
+                job.release()
+        if not queued:
+            return
+        try:
+            result = self.batch.flush()
+        except Exception:
+            # flush logged it, nothing was written
+            for job in queued:
+                job.release(failed=True)
+            return
+        # Release after the flush so a user's sync state only moves past written mail
+        for job, outcome in zip(queued, result["results"]):
+            if outcome["status"] == "failed":
+                job.release(failed=True)
+            else:
+                job.release(found=True)
+        # Anything the API didn't answer for counts as not written
+        for job in queued:
+            job.release(failed=True)
+
+    def _report(self, stop, start):
+        while not stop.wait(PIPELINE_REPORT_INTERVAL):
+            elapsed = time.monotonic() - start
+            logger.info("Pipeline " + ", ".join(
+                f"{stage.name} {stage.processed} done ({stage.processed / elapsed:.1f}/s) queue {stage.inbox.qsize()}"
+                for stage in self.stages
+            ))
+
+    def run(self, users):
+        """Sweep every listening user, returns email -> job emails found (False on error)"""
+        sweeps = [UserSweep(user) for user in users if user['listening']]
+        if not sweeps:
+            return {}
+
+        start = time.monotonic()
+        stop = threading.Event()
+        reporter = threading.Thread(target=self._report, args=(stop, start), name="pipeline-report", daemon=True)
+        reporter.start()
+        self.fetch.workers = min(self.fetch.workers, len(sweeps))
+        for stage in self.stages:
+            stage.start()
+
+        try:
+            for sweep in sweeps:
+                self.fetch.inbox.put(sweep)
+            # Drain front to back, each stage stops once everything before it is done
+            for stage in self.stages:
+                stage.finish()
+        finally:
+            stop.set()
+
+        self.elapsed = time.monotonic() - start
+        logger.info(f"Pipeline swept {len(sweeps)} inboxes in {self.elapsed:.1f}s: " + ", ".join(
+            f"{stage.name} {stage.processed} ({stage.stats(self.elapsed)['utilization']:.0%} busy)"
+            for stage in self.stages
+        ))
+        return {sweep.email: sweep.result for sweep in sweeps}
+
+    def stats(self):
+        elapsed = getattr(self, "elapsed", 0.0)
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+def run_pipeline(users, connect, get_content, **kwargs):
+    """Sweep users through a fresh Pipeline, returns (results, per stage stats)"""
+    pipeline = Pipeline(connect, get_content, **kwargs)
+    results = pipeline.run(users)
+    return results, pipeline.stats()
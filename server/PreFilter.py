@@ -0,0 +1,117 @@
+import os
+import re
+import sys
+import json
+import threading
+from email.utils import parseaddr
+
+# Get environment variables
+PREFILTER_THRESHOLD = float(os.getenv('PREFILTER_THRESHOLD', '1'))
+
+# Applicant tracking systems and job boards that send application mail
+ATS_DOMAINS = (
+    "greenhouse.io", "greenhouse-mail.io", "lever.co", "myworkday.com",
+    "myworkdayjobs.com", "workday.com", "smartrecruiters.com", "icims.com",
+    "jobvite.com", "ashbyhq.com", "taleo.net", "successfactors.com",
+    "bamboohr.com", "workable.com", "recruitee.com", "jazzhr.com",
+    "applytojob.com", "breezy.hr", "teamtailor.com", "personio.de",
+    "eightfold.ai", "phenompeople.com", "avature.net", "oraclecloud.com",
+    "hirebridge.com", "paylocity.com", "ultipro.com", "rippling.com",
+    "indeed.com", "linkedin.com", "handshake.com", "joinhandshake.com",
+    "wellfound.com", "dice.com", "ziprecruiter.com", "glassdoor.com",
+)
+
+# Weighted phrases, subject matches count double
+KEYWORDS = {
+    "application": 2, "applying": 2, "applied": 2, "candidacy": 2,
+    "candidate": 1.5, "interview": 2, "recruit": 1.5, "hiring": 1,
+    "position": 1, "role": 0.5, "job": 0.5, "offer": 1, "talent": 1,
+    "thank you for your interest": 2, "next steps": 1.5, "unfortunately": 1,
+    "move forward": 1.5, "moving forward": 1.5, "not be moving": 2,
+    "other candidates": 2, "resume": 1, "career": 0.5, "assessment": 1,
+    "onsite": 1, "phone screen": 2, "hiring manager": 2,
+}
+_KEYWORD = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in sorted(KEYWORDS, key=len, reverse=True)) + ")")
+BODY_SCAN_CHARS = 5000
+
+class PreFilterStats:
+    """Thread safe counters of how many emails the pre-filter let through"""
+
+    def __init__(self):
+        self.seen = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def record(self, candidate):
+        with self._lock:
+            self.seen += 1
+            if not candidate:
+                self.skipped += 1
+
+    def skip_ratio(self):
+        return self.skipped / self.seen if self.seen else 0.0
+
+    def __str__(self):
+        return f"{self.skipped}/{self.seen} skipped ({self.skip_ratio():.0%})"
+
+stats = PreFilterStats()
+
+def sender_domain(sender):
+    """Domain part of a raw From header, lowercased"""
+    address = parseaddr(str(sender or ""))[1]
+    return address.rpartition("@")[2].lower()
+
+def _keyword_score(text, weight):
+    found = set(_KEYWORD.findall(text.lower()))
+    return sum(KEYWORDS[k] for k in found) * weight
+
+def score(sender, subject, content):
+    """Cheap local score of how likely an email is about a job application"""
+    total = 0.0
+    domain = sender_domain(sender)
+    if any(domain == d or domain.endswith("." + d) for d in ATS_DOMAINS):
+        total += 3
+    total += _keyword_score(str(subject or ""), 2)
+    total += _keyword_score(str(content or "")[:BODY_SCAN_CHARS], 1)
+    return total
+
+def is_candidate(sender, subject, content, threshold=None):
+    """True when the email should go on to the LLM classifier"""
+    threshold = PREFILTER_THRESHOLD if threshold is None else threshold
+    candidate = score(sender, subject, content) >= threshold
+    stats.record(candidate)
+    return candidate
+
+def evaluate(samples, thresholds):
+    """
+    Precision, recall and skip ratio of the pre-filter on labelled samples
+    (dicts with from, subject, content and the LLM type) for each threshold.
+    Job mail is type 1 or 2, a skipped job mail is a lost classification.
+    """
+    scored = [(score(s.get("from"), s.get("subject"), s.get("content")), s.get("type") in (1, 2))
+              for s in samples]
+    report = []
+    for threshold in thresholds:
+        tp = sum(1 for value, job in scored if value >= threshold and job)
+        fp = sum(1 for value, job in scored if value >= threshold and not job)
+        fn = sum(1 for value, job in scored if value < threshold and job)
+        kept = tp + fp
+        report.append({
+            "threshold": threshold,
+            "precision": tp / kept if kept else 0.0,
+            "recall": tp / (tp + fn) if tp + fn else 1.0,
+            "skip_ratio": 1 - kept / len(scored) if scored else 0.0,
+        })
+    return report
+
+if __name__ == "__main__":
+    # Usage: python PreFilter.py labelled.jsonl [threshold ...]
+    if len(sys.argv) < 2:
+        print("Usage: python PreFilter.py labelled.jsonl [threshold ...]")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    thresholds = [float(t) for t in sys.argv[2:]] or [0.5, 1, 2, 3, 4, 6]
+    for row in evaluate(samples, thresholds):
+        print(f"threshold={row['threshold']:<5} precision={row['precision']:.3f} "
+              f"recall={row['recall']:.3f} skip_ratio={row['skip_ratio']:.3f}")
@@ -1,9 +1,20 @@
 import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
 import requests
+import threading
+from typing import List
 from openai import OpenAI
 from textwrap import dedent
 from dotenv import load_dotenv
 from pydantic import BaseModel
+from HttpClient import client as db_client
+from Metrics import LLM_SECONDS, LLM_REQUESTS, CLASSIFICATION_CACHE, record_llm_usage, record_classification
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
@@ -11,12 +22,34 @@ load_dotenv()
 API_KEY = os.getenv('API_KEY')
 DB_API_ADDY = os.getenv('DB_API_ADDY')
 MODEL = os.getenv('MODEL')
+API_BASE_URL = os.getenv('API_BASE_URL')  # optional, e.g. a local OpenAI compatible stub
+LLM_BATCH_SIZE = int(os.getenv('LLM_BATCH_SIZE', '5'))
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '8'))
+CREATE_MISSING_APPLICATIONS = os.getenv('CREATE_MISSING_APPLICATIONS', 'false').lower() == 'true'
+# Defaults to a file next to this module, whatever the working directory
+CACHE_PATH = os.getenv('CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'classification_cache.sqlite3'))
+CACHE_TTL = int(os.getenv('CACHE_TTL', str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
 
 if not all([API_KEY, DB_API_ADDY,MODEL]):
     raise ValueError("Missing required environment variables. Please check your .env file.")
 
 # init some params
-client = OpenAI(api_key=API_KEY)
+client = OpenAI(api_key=API_KEY, base_url=API_BASE_URL or None)
+logger = logging.getLogger(__name__)
+
+# Process wide cap on classifier requests, whichever thread sends them
+llm_slots = threading.BoundedSemaphore(LLM_MAX_IN_FLIGHT)
+_llm_pool = None
+_llm_pool_lock = threading.Lock()
+
+def llm_pool():
+    """The executor every classify_emails call fans its requests out on"""
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            _llm_pool = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT, thread_name_prefix="llm")
+        return _llm_pool
 
 # Prompt
 summarization_prompt = '''
@@ -47,6 +80,12 @@ Here is a description of the parameters:
    - `date`: "-"
 '''
 
+batch_prompt = summarization_prompt + '''
+You will be given several emails at once, each starting with a line "### Email N".
+Classify every email on its own and return exactly one entry per email in `results`,
+in the same order as the emails were given.
+'''
+
 class Email_Classifcation(BaseModel):
     type: int
     company_name: str
@@ -54,101 +93,304 @@ class Email_Classifcation(BaseModel):
     status: str
     date: str
 
-# Function to classify the email
-def classify_email(text: str):
-    completion = client.beta.chat.completions.parse(
-        model=MODEL,
-        temperature=0.2,
-        messages=[
-            {"role": "system", "content": dedent(summarization_prompt)},
-            {"role": "user", "content": text}
-        ],
-        response_format=Email_Classifcation,
-    )
+class Email_Classifcation_Batch(BaseModel):
+    results: List[Email_Classifcation]
 
-    return completion.choices[0].message.parsed
+_URL = re.compile(r'https?://\S+')
+_LONG_NUMBER = re.compile(r'\d{4,}')
+_SPACE = re.compile(r'\s+')
 
-#function to process email
-def prosses_Email(email_classification: Email_Classifcation, email: str):
+def cache_key(text: str):
     """
-    Process the email to update db if nedded
+    Hash an email after normalizing it, so copies that only differ in
+    tracking links, ids, dates or whitespace share one cache entry
     """
+    text = _URL.sub('<url>', text.lower())
+    text = _LONG_NUMBER.sub('#', text)
+    text = _SPACE.sub(' ', text).strip()
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
 
-    if email_classification.type not in [1, 2]:
-        #find a way to mark the email as unread----
+class ClassificationCache:
+    """
+    Persistent sqlite cache of classifications keyed by cache_key, with a
+    TTL and least recently used eviction. The table may run up to a tenth
+    over max_entries, then one trim drops the overflow in a single pass.
+    """
 
-        print("Email not job specific")
-        return None
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.trim_every = max(1, max_entries // 10)
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS classifications ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON classifications (last_used)")
+        self._db.commit()
+        with self._lock:
+            self._trim()
 
-    #create the data to update the db for user(:email)
-    application_data = {
-        "email": email,
-        "company_name": email_classification.company_name,
-        "job_title": email_classification.job_title,
-        "status": email_classification.status
-    }
+    def _trim(self):
+        # Caller holds the lock
+        self._db.execute(
+            "DELETE FROM classifications WHERE key IN ("
+            "SELECT key FROM classifications ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._db.commit()
+        self._puts = 0
 
-    if email_classification.type == 1:
-        try:
-            response = requests.request(
-                method='POST',
-                url=f'{DB_API_ADDY}/applications',
-                json=application_data
+    def get(self, text: str):
+        """Return the cached Email_Classifcation for text, or None"""
+        key = cache_key(text)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM classifications WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._db.execute("DELETE FROM classifications WHERE key = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                CLASSIFICATION_CACHE.labels("miss").inc()
+                return None
+            self._db.execute("UPDATE classifications SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        CLASSIFICATION_CACHE.labels("hit").inc()
+        return Email_Classifcation(**json.loads(row[0]))
+
+    def put(self, text: str, classification):
+        """Store a classification, evicting the least recently used every trim_every puts"""
+        now = time.time()
+        value = json.dumps(classification.model_dump())
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?)",
+                (cache_key(text), value, now, now)
             )
-            response.raise_for_status()
-            print(f"Email Update successfull: {response.json()}")
-            return response.json()
+            self._db.commit()
+            self._puts += 1
+            if self._puts >= self.trim_every:
+                self._trim()
 
-        except requests.exceptions.ConnectionError:
-            print("Failed to connect to the API. Check if it's running and the URL is correct.")
-            return None
-        except requests.exceptions.HTTPError as e:
-            print(f"API returned an error: {e.response.status_code} - {e.response.text}")
-            return None
-        except requests.exceptions.RequestException as e:
-            print(f"An error occurred while making the request: {str(e)}")
-            return None
-        except ValueError as e:
-            print(f"Failed to parse API response as JSON: {str(e)}")
-            return None
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM classifications").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """The process wide ClassificationCache, opened on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ClassificationCache()
+        return _cache
+
+def _complete(text: str):
+    """Classify a single email with one LLM request"""
+    with llm_slots, LLM_SECONDS.labels("single").time():
+        completion = client.beta.chat.completions.parse(
+            model=MODEL,
+            temperature=0.2,
+            messages=[
+                {"role": "system", "content": dedent(summarization_prompt)},
+                {"role": "user", "content": text}
+            ],
+            response_format=Email_Classifcation,
+        )
+    record_llm_usage(completion)
+    LLM_REQUESTS.labels("ok").inc()
+
+    return completion.choices[0].message.parsed
+
+# Function to classify the email
+def classify_email(text: str):
+    cache = get_cache()
+    cached = cache.get(text)
+    if cached is not None:
+        record_classification(cached)
+        return cached
 
-    if email_classification.type == 2:
+    answer = _complete(text)
+    if answer is not None:
+        cache.put(text, answer)
+        record_classification(answer)
+    return answer
+
+def _classify_group(texts: List[str]):
+    """Classify several emails with one request, sharing a single system prompt"""
+    if len(texts) == 1:
+        return [_complete(texts[0])]
+
+    emails = "\n\n".join(f"### Email {i + 1}\n{text}" for i, text in enumerate(texts))
+    with llm_slots, LLM_SECONDS.labels("batch").time():
+        completion = client.beta.chat.completions.parse(
+            model=MODEL,
+            temperature=0.2,
+            messages=[
+                {"role": "system", "content": dedent(batch_prompt)},
+                {"role": "user", "content": emails}
+            ],
+            response_format=Email_Classifcation_Batch,
+        )
+    record_llm_usage(completion)
+
+    parsed = completion.choices[0].message.parsed
+    if parsed is None or len(parsed.results) != len(texts):
+        # The model lost count, fall back to one request per email
+        LLM_REQUESTS.labels("misaligned").inc()
+        logger.warning(f"Batch of {len(texts)} emails came back misaligned, retrying one by one")
+        return [_complete(text) for text in texts]
+    LLM_REQUESTS.labels("ok").inc()
+    return parsed.results
+
+# Function to classify many emails at once
+def classify_emails(texts: List[str], batch_size: int = None, max_in_flight: int = None):
+    """
+    Classify a list of emails, batch_size emails per request with up to
+    max_in_flight of this call's requests running at the same time, and
+    never more than LLM_MAX_IN_FLIGHT across the process. Returns a list
+    lined up with texts; an entry is None when its request failed.
+    """
+    batch_size = max(1, batch_size or LLM_BATCH_SIZE)
+    max_in_flight = max(1, max_in_flight or LLM_MAX_IN_FLIGHT)
+    cache = get_cache()
+    results = [cache.get(text) for text in texts]
+
+    # Only cache misses go to the model, and each distinct email only once
+    pending = {}
+    for i, text in enumerate(texts):
+        if results[i] is None:
+            pending.setdefault(cache_key(text), []).append(i)
+    misses = [texts[indexes[0]] for indexes in pending.values()]
+    groups = [misses[i:i + batch_size] for i in range(0, len(misses), batch_size)]
+
+    for answer in results:
+        if answer is not None:
+            record_classification(answer)
+    if not groups:
+        return results
+
+    def run(group):
         try:
-            response = requests.get(
-                url=f'{DB_API_ADDY}/applications',
-                params={
-                    "email": email,
-                    "company_name": email_classification.company_name,
-                    "job_title": email_classification.job_title
-                }
-            )
-            app_id = response.json()  # This gets the app_id from the response
-            print(f'Application id Found: {app_id}')
+            return _classify_group(group)
+        except Exception as e:
+            LLM_REQUESTS.labels("error").inc()
+            logger.error(f"Error classifying {len(group)} emails: {str(e)}")
+            return [None] * len(group)
 
-            # Then update the status
-            update_response = requests.put(
-                url=f'{DB_API_ADDY}/applications/{app_id}',
-                params={'status_update': email_classification.status}
-            )
-            update_response.raise_for_status()
-            print(f"Status updated successfully: {update_response.json()}")
-            return update_response.json()
+    answers = []
+    if max_in_flight == 1 or len(groups) == 1:
+        for group in groups:
+            answers.extend(run(group))
+    else:
+        # At most max_in_flight of ours queued at once, so one caller can't fill the shared pool
+        window = threading.BoundedSemaphore(max_in_flight)
+        futures = []
+        for group in groups:
+            window.acquire()
+            future = llm_pool().submit(run, group)
+            future.add_done_callback(lambda _: window.release())
+            futures.append(future)
+        for future in futures:
+            answers.extend(future.result())
 
+    for text, indexes, answer in zip(misses, pending.values(), answers):
+        if answer is None:
+            continue
+        cache.put(text, answer)
+        for i in indexes:
+            results[i] = answer
+            record_classification(answer)
+    logger.info(f"Classified {len(texts)} emails, {len(texts) - len(misses)} served from cache")
+    return results
 
-        except requests.exceptions.ConnectionError:
-            print("Failed to connect to the API. Check if it's running and the URL is correct.")
+VALID_STATUSES = {"Pending Response", "Rejected", "Interview Scheduled", "Talk Scheduled", "Offer Received"}
+
+class ApplicationBatch:
+    """
+    Collects application writes from many classified emails (and users)
+    and sends them to the DB API in a single bulk request
+    """
+
+    def __init__(self):
+        self.operations = []
+        self._lock = threading.Lock()
+
+    def add(self, email_classification: Email_Classifcation, email: str, trace_id: str = None):
+        """Queue the db write for one classified email, if it needs one"""
+        if email_classification.type not in [1, 2]:
+            return False
+        if email_classification.status not in VALID_STATUSES:
+            logger.warning(f"Skipping email with unknown status {email_classification.status!r} for {email}")
+            return False
+
+        operation = {
+            "op": "create" if email_classification.type == 1 else "update_status",
+            "email": email,
+            "company_name": email_classification.company_name,
+            "job_title": email_classification.job_title,
+            "status": email_classification.status
+        }
+        if email_classification.type == 2:
+            operation["create_missing"] = CREATE_MISSING_APPLICATIONS
+        if trace_id:
+            operation["trace_id"] = trace_id
+        with self._lock:
+            self.operations.append(operation)
+        return True
+
+    def flush(self):
+        """
+        Send every queued operation in one request. Returns the API result,
+        whose results line up with the operations in the order they were
+        added, or None when nothing was queued. Raises when the request fails.
+        """
+        with self._lock:
+            operations, self.operations = self.operations, []
+        if not operations:
             return None
+
+        try:
+            # Upserts on the natural key, so retrying is safe
+            response = db_client.post(
+                '/applications/bulk',
+                json={"operations": operations},
+                idempotent=True
+            )
+            response.raise_for_status()
+            result = response.json()
+            failed = [outcome for outcome in result['results'] if outcome['status'] == 'failed']
+            logger.info(
+                f"Bulk update: {len(result['created'])} created, {len(result['updated'])} updated, "
+                f"{len(result['missing'])} without a matching application, {len(failed)} failed"
+            )
+            for outcome in failed[:5]:
+                logger.error(f"Bulk operation failed: {outcome.get('error')}")
+            return result
         except requests.exceptions.HTTPError as e:
-            print(f"API returned an error: {e.response.status_code} - {e.response.text}")
-            return None
+            logger.error(f"API returned an error: {e.response.status_code} - {e.response.text}")
+            raise
         except requests.exceptions.RequestException as e:
-            print(f"An error occurred while making the request: {str(e)}")
-            return None
-        except ValueError as e:
-            print(f"Failed to parse API response as JSON: {str(e)}")
-            return None
-
-        response = requests.put(
-            url=f'{DB_API_ADDY}/applications/{app_id}',
-            params={'status_update': email_classification.status}
-        )
+            logger.error(f"Bulk update of {len(operations)} applications failed: {str(e)}")
+            raise
+        except (ValueError, KeyError) as e:
+            logger.error(f"Failed to parse API response as JSON: {str(e)}")
+            raise
@@ -0,0 +1,24 @@
+import os
+import logging
+import threading
+
+# Get environment variables
+MAX_CONCURRENT_USERS = int(os.getenv('MAX_CONCURRENT_USERS', '16'))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv('MAX_CONNECTIONS_PER_HOST', '8'))
+DEFAULT_IMAP_SERVER = "imap.gmail.com"
+
+logger = logging.getLogger(__name__)
+
+class HostLimiter:
+    """Hands out one bounded semaphore per IMAP host"""
+
+    def __init__(self, per_host_limit):
+        self.per_host_limit = max(1, per_host_limit)
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def get(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
@@ -0,0 +1,125 @@
+import os
+import time
+import heapq
+import random
+import logging
+
+# Get environment variables
+POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', '60'))
+POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', '1800'))
+POLL_FAILURE_MAX_BACKOFF = int(os.getenv('POLL_FAILURE_MAX_BACKOFF', str(6 * 60 * 60)))
+# Job mails we are happy to find per check, lower means more frequent checks
+POLL_MAILS_PER_CHECK = float(os.getenv('POLL_MAILS_PER_CHECK', '0.5'))
+RATE_SMOOTHING = 0.3  # weight of the newest check in the arrival rate average
+
+logger = logging.getLogger(__name__)
+
+class UserSchedule:
+    """Polling state of one user"""
+
+    def __init__(self, user, now):
+        self.user = user
+        self.interval = POLL_MIN_INTERVAL
+        # Start as if mail arrives once per minimum interval, so new users are checked often
+        self.rate = POLL_MAILS_PER_CHECK / POLL_MIN_INTERVAL
+        self.failures = 0
+        self.last_checked = None
+        self.next_due = now
+
+class PollScheduler:
+    """
+    Decides which users are due for an inbox check. Users sit in a heap
+    keyed by their next due time. After each check a user's interval is
+    set from a smoothed estimate of their job mail arrival rate, so busy
+    inboxes are checked every POLL_MIN_INTERVAL and quiet ones drift out
+    to POLL_MAX_INTERVAL. Failed checks back off exponentially instead.
+    """
+
+    def __init__(self):
+        self.schedules = {}
+        self.heap = []
+        self.checks = 0
+
+    def sync_users(self, users, now=None):
+        """Track new listening users, refresh passwords and forget the rest"""
+        now = time.monotonic() if now is None else now
+        listening = {user['email']: user for user in users if user['listening']}
+
+        for email_address in list(self.schedules):
+            if email_address not in listening:
+                # Its heap entry is skipped when popped
+                del self.schedules[email_address]
+
+        for email_address, user in listening.items():
+            schedule = self.schedules.get(email_address)
+            if schedule is None:
+                self.schedules[email_address] = UserSchedule(user, now)
+                heapq.heappush(self.heap, (now, email_address))
+            else:
+                if schedule.failures and user['email_app_password'] != schedule.user['email_app_password']:
+                    # New credentials, worth trying again right away
+                    schedule.failures = 0
+                    self._reschedule(email_address, schedule, now)
+                schedule.user = user
+
+    def due(self, now=None):
+        """Pop and return the users whose check is due"""
+        now = time.monotonic() if now is None else now
+        users = []
+        while self.heap and self.heap[0][0] <= now:
+            due_at, email_address = heapq.heappop(self.heap)
+            schedule = self.schedules.get(email_address)
+            # Skip entries of removed users and ones superseded by a reschedule
+            if schedule is None or schedule.next_due != due_at:
+                continue
+            users.append(schedule.user)
+        return users
+
+    def record(self, email_address, found, now=None):
+        """
+        Schedule the next check after one finished. found is the number of
+        job mails the check turned up, or False when it failed.
+        """
+        now = time.monotonic() if now is None else now
+        schedule = self.schedules.get(email_address)
+        if schedule is None:
+            return
+        self.checks += 1
+
+        if found is False:
+            schedule.failures += 1
+            backoff = min(POLL_FAILURE_MAX_BACKOFF, schedule.interval * (2 ** schedule.failures))
+            # Jitter so users on a failing host don't retry in lockstep
+            delay = random.uniform(backoff / 2, backoff)
+            logger.info(f"Check for {email_address} failed {schedule.failures} times, next try in {delay:.0f}s")
+            self._reschedule(email_address, schedule, now + delay)
+            return
+
+        schedule.failures = 0
+        elapsed = now - schedule.last_checked if schedule.last_checked is not None else schedule.interval
+        schedule.last_checked = now
+        observed = int(found) / max(elapsed, 1)
+        schedule.rate = RATE_SMOOTHING * observed + (1 - RATE_SMOOTHING) * schedule.rate
+
+        if schedule.rate > 0:
+            interval = POLL_MAILS_PER_CHECK / schedule.rate
+        else:
+            interval = POLL_MAX_INTERVAL
+        schedule.interval = min(POLL_MAX_INTERVAL, max(POLL_MIN_INTERVAL, interval))
+        self._reschedule(email_address, schedule, now + schedule.interval)
+
+    def _reschedule(self, email_address, schedule, due_at):
+        schedule.next_due = due_at
+        heapq.heappush(self.heap, (due_at, email_address))
+
+    def next_due_in(self, now=None):
+        """Seconds until the next user is due, None when nobody is scheduled"""
+        now = time.monotonic() if now is None else now
+        while self.heap:
+            due_at, email_address = self.heap[0]
+            schedule = self.schedules.get(email_address)
+            if schedule is None or schedule.next_due != due_at:
+                heapq.heappop(self.heap)
+                continue
+            return max(0.0, due_at - now)
+        return None
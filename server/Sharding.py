@@ -0,0 +1,97 @@
+import os
+import socket
+import hashlib
+import logging
+import requests
+import threading
+from HttpClient import client
+
+# Get environment variables
+# "index/count", a fixed split such as one job per GitHub Actions matrix entry
+MONITOR_SHARD = os.getenv('MONITOR_SHARD', '')
+# Name of this worker for DB leases, "auto" uses host and pid
+MONITOR_WORKER_ID = os.getenv('MONITOR_WORKER_ID', '')
+
+logger = logging.getLogger(__name__)
+
+def owner(email_address, workers):
+    """
+    Rendezvous hashing: a user belongs to the worker with the highest
+    hash of (worker, email). When a worker joins or leaves only the users
+    it gains or loses move, everyone else stays where they were.
+    """
+    return max(workers, key=lambda worker: hashlib.sha256(f"{worker}:{email_address}".encode('utf-8')).digest())
+
+class WorkerShard:
+    """
+    This worker's share of the users. With static_workers the split is
+    fixed, otherwise the worker holds a lease in the DB API that a
+    background thread renews every lease_seconds / 3, and the split follows
+    whichever workers currently hold a lease.
+    """
+
+    def __init__(self, worker_id, static_workers=None):
+        self.worker_id = worker_id
+        self.static = static_workers is not None
+        self.workers = list(static_workers) if self.static else [worker_id]
+        self.lease_seconds = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def heartbeat(self):
+        """Renew the lease and refresh the worker list, keeping the old one on failure"""
+        try:
+            response = client.put('/monitor/workers/{worker_id}', path_params={"worker_id": self.worker_id})
+            response.raise_for_status()
+            lease = response.json()
+            if lease["workers"] != self.workers:
+                logger.info(f"Monitor workers changed: {', '.join(lease['workers'])}")
+            self.workers = lease["workers"]
+            self.lease_seconds = lease["lease_seconds"]
+            return True
+        except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Error renewing lease for worker {self.worker_id}: {str(e)}")
+            return False
+
+    def start(self):
+        if self.static or self._thread:
+            return
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.worker_id}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait((self.lease_seconds or 60) / 3):
+            self.heartbeat()
+
+    def stop(self):
+        """Stop renewing and release the lease so the other workers take over now"""
+        if self.static or not self._thread:
+            return
+        self._stop.set()
+        self._thread = None
+        try:
+            client.delete('/monitor/workers/{worker_id}', path_params={"worker_id": self.worker_id})
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Error releasing lease for worker {self.worker_id}: {str(e)}")
+
+    def assign(self, users):
+        """Return the users this worker should scan"""
+        workers = list(self.workers)
+        mine = [user for user in users if owner(user['email'], workers) == self.worker_id]
+        logger.info(f"Worker {self.worker_id} owns {len(mine)} of {len(users)} users ({len(workers)} workers)")
+        return mine
+
+def shard_from_env():
+    """WorkerShard configured by MONITOR_SHARD or MONITOR_WORKER_ID, or None to scan every user"""
+    if MONITOR_SHARD:
+        index, count = (int(part) for part in MONITOR_SHARD.split("/"))
+        if not 0 <= index < count:
+            raise ValueError(f"MONITOR_SHARD must be index/count with 0 <= index < count, got {MONITOR_SHARD}")
+        return WorkerShard(f"shard-{index}", static_workers=[f"shard-{i}" for i in range(count)])
+    if MONITOR_WORKER_ID:
+        worker_id = MONITOR_WORKER_ID
+        if worker_id == "auto":
+            worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        return WorkerShard(worker_id)
+    return None
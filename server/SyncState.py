@@ -0,0 +1,93 @@
+import logging
+import requests
+from HttpClient import client
+from Metrics import IMAP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def load_sync_state(email_address):
+    """
+    Return the stored {uid_validity, last_uid} for a user, or None when
+    there is none yet. Any other failure raises, so a sweep never mistakes
+    an unreachable DB API for a first sync.
+    """
+    try:
+        response = client.get('/users/{email}/sync-state', path_params={"email": email_address})
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.error(f"Error loading sync state for {email_address}: {str(e)}")
+        raise
+
+def save_sync_state(email_address, uid_validity, last_uid):
+    """Persist the user's UIDVALIDITY and last processed UID"""
+    try:
+        response = client.put(
+            '/users/{email}/sync-state',
+            path_params={"email": email_address},
+            json={"uid_validity": uid_validity, "last_uid": last_uid}
+        )
+        response.raise_for_status()
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Error saving sync state for {email_address}: {str(e)}")
+        return False
+
+def _response_number(imap, name):
+    """Read a numeric untagged SELECT response such as UIDVALIDITY"""
+    _, data = imap.response(name)
+    if data and data[-1] is not None:
+        return int(data[-1])
+    return None
+
+def _uid_search(imap, *criteria):
+    with IMAP_SECONDS.labels("search").time():
+        status, data = imap.uid("SEARCH", None, *criteria)
+    if status != "OK" or not data or not data[0]:
+        return []
+    return [int(uid) for uid in data[0].split()]
+
+def new_message_uids(imap, state):
+    """
+    Work out which UIDs need processing on the selected mailbox.
+    Returns (uid_validity, baseline_uid, uids). With a matching stored
+    state only UIDs above last_uid are returned. On the first sync, or when
+    UIDVALIDITY changed, unread mail is picked up and the baseline moves
+    to the current end of the mailbox.
+    """
+    uid_validity = _response_number(imap, "UIDVALIDITY")
+
+    if state and uid_validity is not None and state.get("uid_validity") == uid_validity:
+        last_uid = int(state.get("last_uid") or 0)
+        # n:* always matches the newest message, so filter out old UIDs
+        uids = [uid for uid in _uid_search(imap, "UID", f"{last_uid + 1}:*") if uid > last_uid]
+        return uid_validity, last_uid, uids
+
+    uid_next = _response_number(imap, "UIDNEXT")
+    if uid_next is not None:
+        baseline = uid_next - 1
+    else:
+        baseline = max(_uid_search(imap, "ALL"), default=0)
+    return uid_validity, baseline, _uid_search(imap, "UNSEEN")
+
+def next_high_water(state, uid_validity, last_uid, high_water, failed_uids=(), complete=True):
+    """
+    The last_uid to save once a sweep is done, or None when the stored state
+    should stay as it is. high_water is the last UID actually fetched, and
+    the mark never moves past the first UID whose write failed, so the next
+    sweep fetches it again. A first sync (or a new UIDVALIDITY) with
+    failures, or that stopped fetching early (complete unset), saves
+    nothing, since its baseline sits above the unread mail it picked up.
+    """
+    if uid_validity is None:
+        return None
+    fresh = state is None or state.get("uid_validity") != uid_validity
+    if fresh and (failed_uids or not complete):
+        return None
+    if failed_uids:
+        high_water = min(high_water, min(failed_uids) - 1)
+    if not fresh and high_water == last_uid:
+        return None
+    return high_water
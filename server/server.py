@@ -1,19 +1,31 @@
 import os
 import sys
 import time
-import email
+import atexit
 import signal
 import imaplib
 import logging
 import requests
+from HttpClient import client
 from dotenv import load_dotenv
+from Pipeline import run_pipeline
+from Fetcher import fetch_messages
+from MimeParser import extract_text
+from Sharding import shard_from_env
+from Scheduler import PollScheduler
+from PreFilter import is_candidate
+from IdleListener import IdleListener
 from email.header import decode_header
-from Requests import classify_email, prosses_Email
+from ContentReducer import reduce_content
+from Requests import classify_emails, ApplicationBatch
+from SyncState import load_sync_state, save_sync_state, new_message_uids, next_high_water
+from Metrics import IMAP_SECONDS, SWEEP_SECONDS, LOG_FORMAT, new_trace_id, start_metrics_server
 
 
 load_dotenv()
-# Get environment variables prosses_Email
+# Get environment variables
 DB_API_ADDY = os.getenv('DB_API_ADDY')
+MONITOR_MODE = os.getenv('MONITOR_MODE', 'poll')
 
 if not DB_API_ADDY:
     raise ValueError("Missing required environment variables. Please check your .env file.")
@@ -21,7 +33,7 @@ if not DB_API_ADDY:
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
+    format=LOG_FORMAT
 )
 logger = logging.getLogger(__name__)
 
@@ -31,32 +43,21 @@ def signal_handler(sig, frame):
     sys.exit(0)
 
 def get_email_content(msg):
-    """Extract the email content from the message"""
-    content = ""
-    if msg.is_multipart():
-        # Walk through the parts to find the text content
-        for part in msg.walk():
-            if part.get_content_type() in ["text/plain", "text/html"]:
-                try:
-                    content += part.get_payload(decode=True).decode()
-                except Exception as e:
-                    logger.error(f"Error decoding email part: {str(e)}")
-    else:
-        # If the message is not multipart, just get the payload
-        try:
-            content = msg.get_payload(decode=True).decode()
-        except Exception as e:
-            logger.error(f"Error decoding email: {str(e)}")
-            content = msg.get_payload()
-    return content
+    """Extract the email content from the message, reduced for the classifier"""
+    # First usable text part only, decoded with its own charset and size capped
+    plain_parts, html_parts = extract_text(msg)
+
+    # Prefer plain text, drop quoted history and fit the token budget
+    return reduce_content(plain_parts, html_parts)
 
 def connect_to_email(email_address, password, imap_server="imap.gmail.com"):
     """Connect to email server and return IMAP connection object"""
     try:
-        # Create an IMAP4 class with SSL
-        imap = imaplib.IMAP4_SSL(imap_server)
-        # Authenticate
-        imap.login(email_address, password)
+        with IMAP_SECONDS.labels("connect").time():
+            # Create an IMAP4 class with SSL
+            imap = imaplib.IMAP4_SSL(imap_server)
+            # Authenticate
+            imap.login(email_address, password)
         return imap
     except imaplib.IMAP4.error as e:
         logger.error(f"IMAP connection failed for {email_address}: {str(e)}")
@@ -65,22 +66,27 @@ def connect_to_email(email_address, password, imap_server="imap.gmail.com"):
         logger.error(f"Unexpected error connecting to email: {str(e)}")
         raise
 
+@SWEEP_SECONDS.time()
 def check_for_new_emails(imap,email_address):
-    """Check inbox for new emails and process them"""
+    """
+    Check inbox for new emails and write the job applications found.
+    The sync state only moves past mail whose write went through.
+    Returns the number of job emails found.
+    """
     try:
         # Select the mailbox you want to check
         imap.select("INBOX")
 
-        # Search for all unread emails
-        _, message_numbers = imap.search(None, "UNSEEN")
+        # Only look at mail that arrived since the last processed UID
+        state = load_sync_state(email_address)
+        uid_validity, last_uid, uids = new_message_uids(imap, state)
+        high_water = last_uid
+        emails, nums, traces = [], [], []
 
-        for num in message_numbers[0].split():
+        # Fetch headers and text parts in batches, attachments are skipped
+        for num, email_message in fetch_messages(imap, uids):
+            high_water = max(high_water, int(num))
             try:
-                # Fetch the email message
-                _, msg_data = imap.fetch(num, "(RFC822)")
-                email_body = msg_data[0][1]
-                email_message = email.message_from_bytes(email_body)
-
                 # Get subject
                 subject = decode_header(email_message["Subject"])[0][0]
                 if isinstance(subject, bytes):
@@ -95,51 +101,64 @@ def check_for_new_emails(imap,email_address):
                 content = get_email_content(email_message)
                 #print(content)
 
-                # Create email structure and process
+                # Obvious non job mail never reaches the LLM
+                if not is_candidate(email_message["From"], subject, content):
+                    continue
+
+                # Create email structure and queue it for classification
                 email_ = f"\nFrom: {from_}\nSubject: {subject}\nContent: {content}"
                 #print(email_)
-                answer = classify_email(email_)
-                prosses_Email(answer,email_address)
+                emails.append(email_)
+                nums.append(int(num))
+                # One trace id per email, it follows the email into the DB API
+                traces.append(new_trace_id())
 
             except Exception as e:
                 logger.error(f"Error processing email {num}: {str(e)}")
                 continue
 
+        # Classify the whole batch with concurrent LLM requests
+        batch = ApplicationBatch()
+        queued, failed = [], []
+        for answer, num, trace_id in zip(classify_emails(emails), nums, traces):
+            if answer is None:
+                # The classifier request failed, the next check tries again
+                failed.append(num)
+            elif batch.add(answer, email_address, trace_id):
+                queued.append(num)
+
+        # A failed request raises before the sync state moves, so the next check retries
+        result = batch.flush()
+        outcomes = result["results"] if result else []
+        written = [num for num, outcome in zip(queued, outcomes) if outcome["status"] != "failed"]
+        failed += [num for num in queued if num not in written]
+
+        # Persist the high-water mark so the next run starts after it
+        mark = next_high_water(state, uid_validity, last_uid, high_water, failed)
+        if mark is not None:
+            save_sync_state(email_address, uid_validity, mark)
+        return len(written)
+
     except Exception as e:
         logger.error(f"Error checking for new emails: {str(e)}")
         raise
 
-def check_inbox(email_address, password):
-    """Check inbox once for new emails"""
-    imap = None
-    try:
-        imap = connect_to_email(email_address, password)
-        logger.info(f'Connected to {email_address}\'s email server. Checking for new emails...')
-        check_for_new_emails(imap,email_address)
-        return True
-    except Exception as e:
-        logger.error(f"Error checking inbox for {email_address}: {str(e)}")
-        return False
-    finally:
-        if imap:
-            try:
-                imap.logout()
-            except Exception as e:
-                logger.error(f"Error logging out: {str(e)}")
-
 def fetch_all_users():
-    """Fetch all users from the database"""
-    url = f'{DB_API_ADDY}/users'
+    """Fetch all listening users from the database"""
     try:
-        response = requests.get(url)
+        response = client.get('/users', params={"listening": "true"})
         response.raise_for_status()
         return response.json()
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching users: {str(e)}")
         return None
 
-def monitor_inbox(check_interval=60):
-    """Email monitoring server main loop"""
+def monitor_inbox(refresh_interval=300):
+    """
+    Email monitoring server main loop. Every listening user is checked on
+    their own adaptive schedule (see Scheduler.py) and the user list is
+    refreshed every refresh_interval seconds to pick up signups and changes.
+    """
     logger.info("Starting email monitoring server...")
 
     # Set up signal handlers
@@ -149,33 +168,51 @@ def monitor_inbox(check_interval=60):
     consecutive_failures = 0
     max_failures = 3
 
+    # With several monitors running each one only scans its share of users
+    shard = shard_from_env()
+    if shard:
+        shard.start()
+        atexit.register(shard.stop)
+
+    scheduler = PollScheduler()
+    next_refresh = 0
+
     while True:
         try:
-            start = time.time()
-            users = fetch_all_users()
-
-            if users:
-                consecutive_failures = 0  # Reset counter on success
-                for user in users:
-                    if user['listening']:
-                        try:
-                            check_inbox(user['email'], user['email_app_password'])
-                        except Exception as e:
-                            logger.error(f"Error checking inbox for {user['email']}: {str(e)}")
-                            continue  # Continue with next user
-            else:
-                consecutive_failures += 1
-                if consecutive_failures >= max_failures:
-                    logger.warning("Multiple consecutive failures. Waiting 5 minutes before retry...")
-                    time.sleep(300)  # Wait 5 minutes
-                    consecutive_failures = 0
-
-            logger.info("Done scanning all users unread emails")
-
-            # Calculate sleep time
-            end = time.time()
-            diff = end - start
-            sleep_time = max(0, check_interval - diff)
+            now = time.monotonic()
+            if now >= next_refresh:
+                users = fetch_all_users()
+                if users is not None:
+                    consecutive_failures = 0  # Reset counter on success
+                    scheduler.sync_users(shard.assign(users) if shard else users)
+                    next_refresh = now + refresh_interval
+                else:
+                    # Known users keep being checked, only the list refresh waits
+                    consecutive_failures += 1
+                    retry = 60
+                    if consecutive_failures >= max_failures:
+                        logger.warning("Multiple consecutive failures. Fetching users again in 5 minutes...")
+                        retry = 300
+                        consecutive_failures = 0
+                    next_refresh = now + retry
+
+            due = scheduler.due()
+            if due:
+                results = {}
+                try:
+                    # IMAP fetch, parsing, classification and db writes overlap across users
+                    results, _ = run_pipeline(due, connect_to_email, get_email_content)
+                finally:
+                    # Every popped user goes back on the schedule, even if the sweep blew up
+                    for user in due:
+                        scheduler.record(user['email'], results.get(user['email'], False))
+                logger.info(f"Checked {len(due)} of {len(scheduler.schedules)} inboxes")
+
+            # Sleep until the next user is due or the user list needs refreshing
+            sleep_time = next_refresh - time.monotonic()
+            next_due = scheduler.next_due_in()
+            if next_due is not None:
+                sleep_time = min(sleep_time, next_due)
 
             if sleep_time > 0:
                 time.sleep(sleep_time)
@@ -190,9 +227,43 @@ def monitor_inbox(check_interval=60):
                 logger.error("Too many consecutive failures. Shutting down...")
                 break
 
+def listen_inbox(refresh_interval=300):
+    """
+    Push based main loop: keep one IMAP IDLE connection per listening user
+    and classify only when the server reports new mail. The user list is
+    refreshed every refresh_interval seconds to pick up signups and changes.
+    """
+    logger.info("Starting email listener server...")
+    listener = IdleListener(connect_to_email, check_for_new_emails)
+    shard = shard_from_env()
+    if shard:
+        shard.start()
+        atexit.register(shard.stop)
+
+    def shutdown(sig, frame):
+        logger.info('Shutting down email listener server...')
+        listener.stop()
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    while True:
+        users = fetch_all_users()
+        if users is not None:
+            # Inboxes that moved to another worker are dropped by sync_users
+            listener.sync_users(shard.assign(users) if shard else users)
+            logger.info(f"Listening to {len(listener.workers)} inboxes")
+        time.sleep(refresh_interval)
+
 if __name__ == "__main__":
     try:
-        monitor_inbox()
+        # /metrics on METRICS_PORT for Prometheus to scrape
+        start_metrics_server()
+        if MONITOR_MODE == 'idle':
+            listen_inbox()
+        else:
+            monitor_inbox()
     except Exception as e:
         logger.critical(f"Fatal error: {str(e)}")
         sys.exit(1)
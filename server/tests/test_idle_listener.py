@@ -0,0 +1,92 @@
+"""IdleListener against benchmarks/fake_imap.py, a local IMAP server with IDLE"""
+import os
+import sys
+import imaplib
+import threading
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [os.path.join(ROOT, "server"), os.path.join(ROOT, "benchmarks")]
+
+import IdleListener
+from fake_imap import FakeImapServer
+
+USER = "idle@test.example"
+
+class Syncs:
+    """on_new_mail stand-in that counts calls and can run a hook on one of them"""
+
+    def __init__(self, hook=None):
+        self.calls = 0
+        self.hook = hook
+        self.changed = threading.Condition()
+
+    def __call__(self, imap, email_address):
+        with self.changed:
+            self.calls += 1
+            calls = self.calls
+        if self.hook:
+            self.hook(imap, calls)
+        with self.changed:
+            self.changed.notify_all()
+
+    def wait_for(self, calls, timeout=5):
+        with self.changed:
+            return self.changed.wait_for(lambda: self.calls >= calls, timeout)
+
+@pytest.fixture
+def server():
+    server = FakeImapServer(inbox_size=3).start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def listen(server, monkeypatch):
+    # Long enough that only pushed or buffered EXISTS can trigger a sync
+    monkeypatch.setattr(IdleListener, "IDLE_TIMEOUT", 60)
+    listeners = []
+
+    def connect(email_address, password):
+        imap = imaplib.IMAP4("127.0.0.1", server.port)
+        imap.login(email_address, password)
+        return imap
+
+    def listen(on_new_mail, password="app-password"):
+        listener = IdleListener.IdleListener(connect, on_new_mail)
+        listener.sync_users([{"email": USER, "email_app_password": password, "listening": True}])
+        listeners.append(listener)
+        return listener
+
+    yield listen
+    for listener in listeners:
+        listener.stop()
+
+def test_pushed_mail_triggers_a_sync(server, listen):
+    syncs = Syncs()
+    listen(syncs)
+    assert syncs.wait_for(1)
+
+    server.deliver(USER, "jobs@lever.co", "Thank you for applying", "We received your application.")
+    assert syncs.wait_for(2)
+
+def test_mail_reported_during_a_sync_is_not_missed(server, listen):
+    def deliver_mid_sync(imap, calls):
+        if calls == 1:
+            # The server reports it on this NOOP, so IDLE never announces it
+            server.deliver(USER, "jobs@lever.co", "Interview invitation", "Pick a slot for a phone screen.")
+            imap.noop()
+
+    syncs = Syncs(deliver_mid_sync)
+    listen(syncs)
+    assert syncs.wait_for(2)
+
+def test_sync_users_waits_for_replaced_workers(listen):
+    syncs = Syncs()
+    listener = listen(syncs)
+    assert syncs.wait_for(1)
+    old = listener.workers[USER]
+
+    listener.sync_users([{"email": USER, "email_app_password": "new-password", "listening": True}])
+    assert not old.is_alive()
+    assert listener.workers[USER] is not old
+    assert syncs.wait_for(2)
@@ -0,0 +1,69 @@
+"""next_high_water and the UserSweep that saves it, without IMAP or the DB API"""
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path[:0] = [os.path.join(ROOT, "server")]
+for key, value in {"API_KEY": "sk-test", "MODEL": "gpt-4o-mini", "DB_API_ADDY": "http://127.0.0.1:8000"}.items():
+    os.environ.setdefault(key, value)
+
+import Pipeline
+from SyncState import next_high_water
+
+STORED = {"uid_validity": 1, "last_uid": 5}
+
+@pytest.mark.parametrize("state, failed_uids, complete, expected", [
+    # First sync, the baseline is UIDNEXT - 1
+    (None, [], True, 10),
+    (None, [7], True, None),
+    (None, [], False, None),
+    (None, [7], False, None),
+    # Stored state, new mail up to UID 10
+    (STORED, [], True, 10),
+    (STORED, [7, 9], True, 6),
+    (STORED, [], False, 10),
+    (STORED, [9], False, 8),
+    (STORED, [6], False, None),
+])
+def test_next_high_water(state, failed_uids, complete, expected):
+    assert next_high_water(state, 1, 5, 10, failed_uids, complete=complete) == expected
+
+def test_next_high_water_new_uid_validity_is_a_first_sync():
+    assert next_high_water(STORED, 2, 0, 10) == 10
+    assert next_high_water(STORED, 2, 0, 10, [], complete=False) is None
+
+def test_next_high_water_without_uid_validity_saves_nothing():
+    assert next_high_water(None, None, 0, 10) is None
+
+@pytest.fixture
+def saved(monkeypatch):
+    saved = []
+    monkeypatch.setattr(Pipeline, "save_sync_state", lambda email, uid_validity, mark: saved.append(mark))
+    return saved
+
+def sweep(state, high_water):
+    sweep = Pipeline.UserSweep({"email": "user@test.example"})
+    sweep.state, sweep.uid_validity, sweep.last_uid = state, 1, (state or {}).get("last_uid", 10)
+    sweep.high_water = high_water
+    return sweep
+
+@pytest.mark.parametrize("state, failed_uids, fetch_failed, expected", [
+    (None, [], False, [10]),
+    (None, [8], False, []),
+    (None, [], True, []),
+    (STORED, [], False, [9]),
+    (STORED, [8], False, [7]),
+    (STORED, [], True, [9]),
+    (STORED, [8], True, [7]),
+])
+def test_user_sweep_finish(saved, state, failed_uids, fetch_failed, expected):
+    user = sweep(state, 9 if state else 10)
+    for uid in (7, 8, 9):
+        user.add()
+    for uid in (7, 8, 9):
+        user.release(failed_uid=uid if uid in failed_uids else None)
+    user.fetch_done(failed=fetch_failed)
+
+    assert saved == expected
+    assert user.result == (False if failed_uids or fetch_failed else 0)
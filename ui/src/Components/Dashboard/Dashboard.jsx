@@ -51,7 +51,7 @@ const Dashboard = () => {
 
       try {
         const response = await fetch(
-          `${DB_API_ADDY}/applications/user/${user.email}`,
+          `${DB_API_ADDY}/applications/user/${user.email}?fields=app_id,company_name,job_title,status,app_date`,
           {
             headers: {
               Authorization: `Bearer ${token}`,
@@ -90,6 +90,72 @@ const Dashboard = () => {
     };
 
     fetchApplications();
+
+    // Apply inserts and status changes pushed by the API instead of refetching
+    const token = localStorage.getItem("token");
+    if (!token) return;
+
+    let stream = null;
+    let retry = null;
+    let closed = false;
+
+    const applyChange = (event) => {
+      const changed = JSON.parse(event.data);
+      setApplications((current) => {
+        // Names can differ in spelling from the stored ones, app_id can't
+        const others = current.filter((app) => app.app_id !== changed.app_id);
+        return [...others, changed];
+      });
+    };
+
+    const reconnect = () => {
+      if (!closed) retry = setTimeout(() => openStream(true), 5000);
+    };
+
+    // The stream URL carries a single use ticket, never the access token
+    const openStream = async (reopening = false) => {
+      try {
+        const response = await fetch(
+          `${DB_API_ADDY}/applications/stream/ticket`,
+          {
+            method: "POST",
+            headers: { Authorization: `Bearer ${token}` },
+          },
+        );
+        if (!response.ok) throw new Error("Failed to get a stream ticket");
+        const { ticket } = await response.json();
+        if (closed) return;
+
+        stream = new EventSource(
+          `${DB_API_ADDY}/applications/stream?ticket=${encodeURIComponent(ticket)}`,
+        );
+      } catch (error) {
+        console.error("Error opening application stream:", error);
+        reconnect();
+        return;
+      }
+
+      stream.addEventListener("created", applyChange);
+      stream.addEventListener("updated", applyChange);
+      // Sent when we fell behind and missed events
+      stream.addEventListener("resync", fetchApplications);
+      // Catch up on whatever changed while the last stream was down
+      if (reopening) stream.onopen = fetchApplications;
+      stream.onerror = () => {
+        // The browser would retry with the used ticket, so get a new one
+        stream.close();
+        stream = null;
+        reconnect();
+      };
+    };
+
+    openStream();
+
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      if (stream) stream.close();
+    };
   }, [navigate]);
 
   const toggleDark = () => {
@@ -239,8 +305,8 @@ const Dashboard = () => {
                     </td>
                   </tr>
                 ) : (
-                  filteredAndSortedApplications.map((app, index) => (
-                    <tr key={index}>
+                  filteredAndSortedApplications.map((app) => (
+                    <tr key={app.app_id}>
                       <td>{app.company_name}</td>
                       <td>{app.job_title}</td>
                       <td>